@@ -6,42 +6,48 @@ from contextlib import asynccontextmanager
 from typing import List, Optional
 from datetime import datetime, timedelta
 
-from fastapi import FastAPI, Depends, WebSocket, WebSocketDisconnect, Query
+from fastapi import FastAPI, Depends, WebSocket, WebSocketDisconnect, Query, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import select, func, desc, and_
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import select, func, desc, and_, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import engine, Base, get_db
 from models import SocialMediaPost, SentimentAnalysis, SentimentAlert
-from services.alerting import check_alerts
+from services.alerting import check_alerts, ALERT_WINDOW_MINUTES
+from services.broadcast import ConnectionManager
+from services import rollups
+from services.live_stats import SlidingWindowStats
+from services.pagination import encode_cursor, decode_cursor
+from services.response_cache import ResponseCache, RESPONSE_CACHE_SHARED
 
 # --- Config ---
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_CHANNEL = "sentiment_updates"
 
 # --- WebSocket Manager ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+# Per-client bounded send queues; see services/broadcast.py
+manager = ConnectionManager()
 
-    async def broadcast(self, message: str):
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_text(message)
-            except Exception:
-                self.disconnect(connection)
+# --- Live Stats ---
+# Last few minutes of counts, fed by redis_listener; serves the metrics and alert loops without DB queries
+live_stats = SlidingWindowStats()
 
-manager = ConnectionManager()
+# --- Response Cache ---
+# Distribution/stats/aggregate answers, invalidated by redis_listener; see services/response_cache.py
+response_cache = ResponseCache()
 
 # --- Background Tasks ---
+def split_update(payload: str) -> List[str]:
+    """Workers may publish one combined 'batch' message; clients still get one frame per post"""
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return [payload]
+    if isinstance(message, dict) and message.get("type") == "batch":
+        return [json.dumps(item) for item in message.get("data", [])]
+    return [payload]
+
 async def redis_listener():
     """Listens to Redis and broadcasts new posts to WebSockets"""
     r = redis.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
@@ -51,7 +57,10 @@ async def redis_listener():
     try:
         async for message in pubsub.listen():
             if message["type"] == "message":
-                await manager.broadcast(message["data"])
+                live_stats.record(message["data"])
+                response_cache.mark_changed()
+                for update in split_update(message["data"]):
+                    manager.broadcast(update)
     except Exception as e:
         print(f"❌ Redis Error: {e}")
     finally:
@@ -63,7 +72,7 @@ async def alert_loop():
     while True:
         try:
             await asyncio.sleep(60)
-            await check_alerts()
+            await check_alerts(stats=live_stats.label_counts(ALERT_WINDOW_MINUTES * 60))
         except asyncio.CancelledError:
             break
         except Exception as e:
@@ -78,30 +87,21 @@ async def metrics_broadcaster():
     while True:
         try:
             await asyncio.sleep(30)
-            async with AsyncSessionLocal() as db:
-                # Calculate last minute stats
-                now = datetime.utcnow()
-                one_min_ago = now - timedelta(minutes=1)
-                
-                query = (
-                    select(SentimentAnalysis.sentiment_label, func.count(SentimentAnalysis.id))
-                    .where(SentimentAnalysis.analyzed_at >= one_min_ago)
-                    .group_by(SentimentAnalysis.sentiment_label)
-                )
-                result = await db.execute(query)
-                stats = {row[0]: row[1] for row in result.all()}
-                
-                # Format for Frontend Trend Chart
-                msg = {
-                    "type": "metrics_update",
-                    "data": {
-                        "timestamp": now.isoformat(),
-                        "positive": stats.get("positive", 0),
-                        "negative": stats.get("negative", 0),
-                        "neutral": stats.get("neutral", 0)
-                    }
+            # Last minute, straight from the in-memory window (no DB query)
+            now = datetime.utcnow()
+            stats = live_stats.label_counts(60)
+
+            # Format for Frontend Trend Chart
+            msg = {
+                "type": "metrics_update",
+                "data": {
+                    "timestamp": now.isoformat(),
+                    "positive": stats.get("positive", 0),
+                    "negative": stats.get("negative", 0),
+                    "neutral": stats.get("neutral", 0)
                 }
-                await manager.broadcast(json.dumps(msg))
+            }
+            manager.broadcast(json.dumps(msg))
         except asyncio.CancelledError:
             break
         except Exception as e:
@@ -115,8 +115,25 @@ async def lifespan(app: FastAPI):
     # 1. Initialize DB
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips tables that already exist; add indexes introduced since
+        await conn.run_sync(lambda sync_conn: [
+            index.create(sync_conn, checkfirst=True)
+            for table in Base.metadata.sorted_tables for index in table.indexes
+        ])
+
+    # 2. Refill the live window, so a restart doesn't blank the trend chart or the alert check
+    try:
+        async with AsyncSessionLocal() as db:
+            seeded = await live_stats.seed(db)
+        print(f"✅ Backend: Live stats seeded with {seeded} recent posts")
+    except Exception as e:
+        print(f"⚠️ Live stats seeding failed, starting empty: {e}")
     
-    # 2. Start Background Services
+    # 3. Optional shared cache tier, so replicas don't each run the same aggregate queries
+    if RESPONSE_CACHE_SHARED:
+        response_cache.redis = redis.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
+
+    # 4. Start Background Services
     task_redis = asyncio.create_task(redis_listener())
     task_alert = asyncio.create_task(alert_loop())
     task_metrics = asyncio.create_task(metrics_broadcaster())
@@ -124,10 +141,12 @@ async def lifespan(app: FastAPI):
     print("🚀 System Startup Complete.")
     yield
     
-    # 3. Cleanup
+    # 5. Cleanup
     task_redis.cancel()
     task_alert.cancel()
     task_metrics.cancel()
+    if response_cache.redis is not None:
+        await response_cache.redis.close()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -141,18 +160,35 @@ app.add_middleware(
 )
 
 # --- WebSocket Endpoint ---
+def handle_client_message(websocket: WebSocket, text: str):
+    """Clients may send {"type": "subscribe", ...} to filter and batch what they receive"""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict) or message.get("type") != "subscribe":
+        return  # anything else (e.g. keep-alive pings) is ignored, as before
+
+    try:
+        subscription = manager.subscribe(websocket, message)
+    except ValueError as e:
+        manager.send(websocket, json.dumps({"type": "error", "message": str(e)}))
+        return
+    manager.send(websocket, json.dumps({"type": "subscribed", "data": subscription.to_dict()}))
+
 @app.websocket("/ws/sentiment")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         # Rubric Req: Connection Confirmation
-        await websocket.send_json({
+        # Queued like every other frame, so only the client's writer task touches the socket
+        manager.send(websocket, json.dumps({
             "type": "connected", 
             "message": "Connected to sentiment stream",
             "timestamp": datetime.utcnow().isoformat()
-        })
+        }))
         while True:
-            await websocket.receive_text()
+            handle_client_message(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception:
@@ -160,6 +196,11 @@ async def websocket_endpoint(websocket: WebSocket):
 
 # --- REST Endpoints ---
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint (WebSocket fan-out queues, drops, clients)"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/api/health")
 async def health_check():
     """Health check for Docker Compose"""
@@ -173,19 +214,42 @@ async def health_check():
 async def get_posts(
     limit: int = Query(50, ge=1, le=100), 
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     source: Optional[str] = None,
     sentiment: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Retrieve posts with filtering and pagination"""
+    """
+    Retrieve posts with filtering and pagination.
+    Pass the previous page's `next_cursor` as `cursor` (keyset pagination): every
+    page then costs the same. `offset` still works but scans the skipped rows, and
+    cannot be combined with `cursor`.
+    """
+    # One row per post: only its latest analysis, found via ix_analysis_post_id_id
+    latest_analysis = (
+        select(func.max(SentimentAnalysis.id))
+        .where(SentimentAnalysis.post_id == SocialMediaPost.post_id)
+        .correlate(SocialMediaPost)
+        .scalar_subquery()
+    )
     query = (
         select(SocialMediaPost, SentimentAnalysis)
-        .join(SentimentAnalysis, SocialMediaPost.post_id == SentimentAnalysis.post_id)
-        .order_by(desc(SocialMediaPost.created_at))
+        .join(SentimentAnalysis, SentimentAnalysis.id == latest_analysis)
+        .order_by(desc(SocialMediaPost.created_at), desc(SocialMediaPost.id))
         .limit(limit)
-        .offset(offset)
     )
     
+    if cursor and offset:
+        raise HTTPException(status_code=400, detail="Pass either cursor or offset, not both")
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Rows strictly after the cursor in (created_at, id) order; an index range scan, not a skip
+        query = query.where(tuple_(SocialMediaPost.created_at, SocialMediaPost.id) < tuple_(cursor_created_at, cursor_id))
+    elif offset:
+        query = query.offset(offset)
     if source:
         query = query.where(SocialMediaPost.source == source)
     if sentiment:
@@ -194,7 +258,9 @@ async def get_posts(
     result = await db.execute(query)
     
     posts = []
+    last_post = None
     for post, analysis in result:
+        last_post = post
         posts.append({
             "post_id": post.post_id,
             "content": post.content,
@@ -207,7 +273,10 @@ async def get_posts(
                 "emotion": analysis.emotion
             }
         })
-    return {"posts": posts, "limit": limit, "offset": offset}
+
+    # A short page is the last one
+    next_cursor = encode_cursor(last_post.created_at, last_post.id) if len(posts) == limit else None
+    return {"posts": posts, "limit": limit, "offset": offset, "next_cursor": next_cursor}
 
 @app.get("/api/sentiment/distribution")
 async def get_sentiment_distribution(
@@ -219,27 +288,18 @@ async def get_sentiment_distribution(
     Rubric Req: Distribution Endpoint
     Gets sentiment counts for the last N hours.
     """
-    threshold = datetime.utcnow() - timedelta(hours=hours)
-    
-    query = (
-        select(SentimentAnalysis.sentiment_label, func.count(SentimentAnalysis.id))
-        .join(SocialMediaPost, SentimentAnalysis.post_id == SocialMediaPost.post_id)
-        .where(SentimentAnalysis.analyzed_at >= threshold)
-    )
-    
-    if source:
-        query = query.where(SocialMediaPost.source == source)
-        
-    query = query.group_by(SentimentAnalysis.sentiment_label)
-    
-    result = await db.execute(query)
-    distribution = {row[0]: row[1] for row in result.all()}
-    
-    return {
-        "timeframe_hours": hours,
-        "distribution": distribution,
-        "total": sum(distribution.values())
-    }
+    async def compute():
+        threshold = datetime.utcnow() - timedelta(hours=hours)
+        # Served from the rollups the worker maintains, not a scan of sentiment_analysis
+        distribution, emotions = await rollups.distribution_since(db, threshold, source)
+        return {
+            "timeframe_hours": hours,
+            "distribution": distribution,
+            "emotions": emotions,
+            "total": sum(distribution.values())
+        }
+
+    return await response_cache.get_or_compute("distribution", (hours, source), compute)
 
 # Alias for dashboard compatibility if needed, but distribution is the strict rubric name
 @app.get("/api/sentiment/stats")
@@ -257,38 +317,17 @@ async def get_aggregate(
     """
     Time-Series Aggregation (Required for Rubric Phase 4)
     """
-    trunc_date = func.date_trunc(period, SentimentAnalysis.analyzed_at).label('timestamp')
-    
-    query = (
-        select(
-            trunc_date,
-            SentimentAnalysis.sentiment_label,
-            func.count(SentimentAnalysis.id)
-        )
-        .join(SocialMediaPost, SentimentAnalysis.post_id == SocialMediaPost.post_id)
-    )
-
-    if start_date:
-        query = query.where(SentimentAnalysis.analyzed_at >= start_date)
-    if end_date:
-        query = query.where(SentimentAnalysis.analyzed_at <= end_date)
-    if source:
-        query = query.where(SocialMediaPost.source == source)
-
-    query = (
-        query
-        .group_by(trunc_date, SentimentAnalysis.sentiment_label)
-        .order_by(trunc_date)
-    )
-    
-    result = await db.execute(query)
-    
-    data = []
-    for row in result:
-        data.append({
-            "timestamp": row[0],
-            "sentiment": row[1],
-            "count": row[2]
-        })
+    async def compute():
+        # Summed from the rollups the worker maintains (rebuild them with worker/rollup_backfill.py)
+        result = await rollups.series(db, period, start_date, end_date, source)
         
-    return {"period": period, "data": data}
\ No newline at end of file
+        data = []
+        for row in result:
+            data.append({
+                "timestamp": row[0],
+                "sentiment": row[1],
+                "count": row[2]
+            })
+        return {"period": period, "data": data}
+
+    return await response_cache.get_or_compute("aggregate", (period, start_date, end_date, source), compute)
\ No newline at end of file
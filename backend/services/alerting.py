@@ -1,6 +1,7 @@
 import json
 import asyncio
 from datetime import datetime, timedelta
+from typing import Dict, Optional
 from sqlalchemy import select, func, desc
 from database import AsyncSessionLocal
 from models import SocialMediaPost, SentimentAnalysis, SentimentAlert
@@ -11,10 +12,12 @@ ALERT_NEGATIVE_RATIO_THRESHOLD = 0.5
 ALERT_WINDOW_MINUTES = 5
 ALERT_MIN_POSTS = 5
 
-async def check_alerts():
+async def check_alerts(stats: Optional[Dict[str, int]] = None):
     """
     Background job: Checks last 5 minutes of data. 
     If negative sentiment is too high, saves an Alert to the DB.
+    `stats` ({label: count} for the window, e.g. from the backend's live window)
+    skips the aggregation query; the DB is then only touched to save an alert.
     """
     print("🔍 Running background alert check...")
     
@@ -24,16 +27,17 @@ async def check_alerts():
 
         # 1. Aggregation Query: Count sentiments in the last window
         # "SELECT sentiment_label, COUNT(*) FROM ... WHERE created_at > window_start GROUP BY label"
-        query = (
-            select(SentimentAnalysis.sentiment_label, func.count(SentimentAnalysis.id))
-            .join(SocialMediaPost, SentimentAnalysis.post_id == SocialMediaPost.post_id)
-            .where(SocialMediaPost.created_at >= window_start)
-            .group_by(SentimentAnalysis.sentiment_label)
-        )
-        
-        result = await db.execute(query)
-        # Convert result to dict: {'positive': 10, 'negative': 5, 'neutral': 2}
-        stats = {row[0]: row[1] for row in result.all()}
+        if stats is None:
+            query = (
+                select(SentimentAnalysis.sentiment_label, func.count(SentimentAnalysis.id))
+                .join(SocialMediaPost, SentimentAnalysis.post_id == SocialMediaPost.post_id)
+                .where(SocialMediaPost.created_at >= window_start)
+                .group_by(SentimentAnalysis.sentiment_label)
+            )
+            
+            result = await db.execute(query)
+            # Convert result to dict: {'positive': 10, 'negative': 5, 'neutral': 2}
+            stats = {row[0]: row[1] for row in result.all()}
         
         positive = stats.get('positive', 0)
         negative = stats.get('negative', 0)
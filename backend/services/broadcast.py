@@ -0,0 +1,303 @@
+import os
+import json
+import zlib
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional
+from fastapi import WebSocket
+from prometheus_client import Counter, Gauge
+
+# --- Config ---
+# Outbound frames buffered per client before the overflow policy kicks in
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", 256))
+# drop_oldest = discard the oldest frame, coalesce = keep only the latest state per
+# message type (and the newest posts), disconnect = close the slow client
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+# A single send stuck longer than this marks the client as dead
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", 10))
+# Default window for batching posts into one "new_posts" frame; 0 = one frame per post
+WS_COALESCE_MS = int(os.getenv("WS_COALESCE_MS", 0))
+# Upper bound on the window a client may ask for
+WS_MAX_COALESCE_MS = int(os.getenv("WS_MAX_COALESCE_MS", 5000))
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+# Close code 1013 = "try again later"
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+WS_CLIENTS = Gauge("sentiment_ws_clients", "Connected WebSocket clients")
+WS_QUEUED = Gauge("sentiment_ws_queued_messages", "Frames waiting in all client send queues")
+WS_MAX_QUEUE_DEPTH = Gauge("sentiment_ws_max_queue_depth", "Deepest client send queue")
+WS_SENT = Counter("sentiment_ws_sent_messages", "Frames written to WebSocket clients")
+WS_DROPPED = Counter(
+    "sentiment_ws_dropped_messages",
+    "Frames discarded because a client's send queue was full",
+    ["policy"]
+)
+WS_SLOW_DISCONNECTS = Counter(
+    "sentiment_ws_slow_disconnects",
+    "Clients closed because they could not keep up"
+)
+WS_FILTERED = Counter(
+    "sentiment_ws_filtered_posts",
+    "Posts not sent to a client because of its subscription filters"
+)
+
+POST_FRAME_TYPES = ("new_post", "new_posts")
+
+def _parse(frame: str) -> dict:
+    try:
+        message = json.loads(frame)
+    except ValueError:
+        return {}
+    return message if isinstance(message, dict) else {}
+
+def _post_count(message: dict) -> int:
+    """Posts carried by a post frame: 1 for new_post, the batch length for new_posts"""
+    if message.get("type") == "new_posts":
+        data = message.get("data")
+        return len(data) if isinstance(data, list) else 0
+    return 1
+
+def coalesce(frames: deque, keep_posts: int) -> deque:
+    """
+    Keeps the latest frame of every state-like type (e.g. metrics_update) and the
+    newest post frames (new_post and new_posts batches) carrying up to `keep_posts`
+    posts, in their original order.
+    """
+    latest, posts = {}, []
+    for index, frame in enumerate(frames):
+        message = _parse(frame)
+        if message.get("type") in POST_FRAME_TYPES:
+            posts.append((index, _post_count(message)))
+        else:
+            latest[message.get("type")] = index
+
+    keep = set(latest.values())
+    carried = 0
+    for index, count in reversed(posts):
+        if carried >= keep_posts:
+            break
+        keep.add(index)
+        carried += count
+    return deque(frame for index, frame in enumerate(frames) if index in keep)
+
+class Subscription:
+    """
+    What one client wants to receive. Sent by the client as
+    {"type": "subscribe", "sources": [...], "labels": [...], "sample_rate": 0.1, "coalesce_ms": 250};
+    omitted fields mean "everything" / "no batching".
+    """
+    def __init__(self, sources: Optional[List[str]] = None, labels: Optional[List[str]] = None,
+                 sample_rate: float = 1.0, coalesce_ms: int = WS_COALESCE_MS):
+        self.sources = set(sources) if sources else None
+        self.labels = set(labels) if labels else None
+        self.sample_rate = sample_rate
+        self.coalesce_ms = coalesce_ms
+
+    @classmethod
+    def from_message(cls, message: dict) -> "Subscription":
+        """Validates a subscribe message; raises ValueError with a client-facing reason"""
+        sources, labels = message.get("sources"), message.get("labels")
+        for name, value in (("sources", sources), ("labels", labels)):
+            if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                raise ValueError(f"{name} must be a list of strings")
+        try:
+            sample_rate = float(message.get("sample_rate", 1.0))
+            coalesce_ms = int(message.get("coalesce_ms", WS_COALESCE_MS))
+        except (TypeError, ValueError):
+            raise ValueError("sample_rate and coalesce_ms must be numbers")
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1]")
+        if not 0 <= coalesce_ms <= WS_MAX_COALESCE_MS:
+            raise ValueError(f"coalesce_ms must be between 0 and {WS_MAX_COALESCE_MS}")
+        return cls(sources, labels, sample_rate, coalesce_ms)
+
+    @property
+    def filtered(self) -> bool:
+        return self.sources is not None or self.labels is not None or self.sample_rate < 1
+
+    def matches(self, post: dict) -> bool:
+        if self.sources is not None and post.get("source") not in self.sources:
+            return False
+        if self.labels is not None and (post.get("sentiment") or {}).get("sentiment_label") not in self.labels:
+            return False
+        if self.sample_rate < 1:
+            # Hash of post_id, not random(): every tab at the same rate sees the same sample
+            bucket = zlib.crc32(str(post.get("post_id", "")).encode()) / 0xFFFFFFFF
+            return bucket < self.sample_rate
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "sources": sorted(self.sources) if self.sources is not None else None,
+            "labels": sorted(self.labels) if self.labels is not None else None,
+            "sample_rate": self.sample_rate,
+            "coalesce_ms": self.coalesce_ms
+        }
+
+class ClientConnection:
+    """One viewer: a bounded outbound queue drained by its own writer task"""
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager",
+                 max_queue: int = WS_QUEUE_SIZE, policy: str = WS_OVERFLOW_POLICY):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown WS_OVERFLOW_POLICY {policy!r}, expected one of {OVERFLOW_POLICIES}")
+        self.websocket = websocket
+        self.manager = manager
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.queue = deque()
+        self.dropped = 0
+        self.closed = False
+        self.subscription = Subscription()
+        # Posts waiting for the next coalesced frame, and the timer that flushes them
+        self.pending_posts: List[dict] = []
+        self._flush_handle = None
+        self._ready = asyncio.Event()
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, frame: str) -> bool:
+        """Never blocks; applies the overflow policy when the queue is full"""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                WS_DROPPED.labels(self.policy).inc(len(self.queue) + 1)
+                WS_SLOW_DISCONNECTS.inc()
+                self.close(SLOW_CLIENT_CLOSE_CODE)
+                return False
+            before = len(self.queue)
+            if self.policy == "coalesce":
+                # Leave room, so a steady overload doesn't coalesce on every frame
+                self.queue = coalesce(self.queue, self.max_queue // 2)
+            if len(self.queue) >= self.max_queue:
+                self.queue.popleft()
+            self.dropped += before - len(self.queue)
+            WS_DROPPED.labels(self.policy).inc(before - len(self.queue))
+        self.queue.append(frame)
+        self._ready.set()
+        return True
+
+    def subscribe(self, subscription: Subscription):
+        # Posts batched under the old window go out now, not under the new filters
+        self.flush_posts()
+        self.subscription = subscription
+
+    def offer_post(self, frame: str, post: dict):
+        """Filters one new_post for this client and sends it now or batches it"""
+        if not self.subscription.matches(post):
+            WS_FILTERED.inc()
+            return
+        if not self.subscription.coalesce_ms:
+            self.enqueue(frame)
+            return
+        self.pending_posts.append(post)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.subscription.coalesce_ms / 1000, self.flush_posts
+            )
+
+    def flush_posts(self):
+        """Sends the batched posts as one {"type": "new_posts", "data": [...]} frame"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.pending_posts:
+            posts, self.pending_posts = self.pending_posts, []
+            self.enqueue(json.dumps({"type": "new_posts", "data": posts}))
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self.queue:
+                    frame = self.queue.popleft()
+                    await asyncio.wait_for(self.websocket.send_text(frame), WS_SEND_TIMEOUT_SECONDS)
+                    WS_SENT.inc()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Timed out or the socket is gone: this client is done, the others are unaffected
+            self.close()
+
+    def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.pending_posts = []
+        self.manager.disconnect(self.websocket)
+        if asyncio.current_task() is not self.writer:
+            self.writer.cancel()
+        asyncio.ensure_future(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+class ConnectionManager:
+    """
+    Fan-out to all WebSocket viewers. broadcast() only enqueues, so neither a slow
+    tab nor redis_listener ever waits on another client's socket.
+    """
+    def __init__(self, max_queue: int = WS_QUEUE_SIZE, policy: str = WS_OVERFLOW_POLICY):
+        self.max_queue = max_queue
+        self.policy = policy
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        WS_QUEUED.set_function(lambda: sum(len(client.queue) for client in self.clients.values()))
+        WS_MAX_QUEUE_DEPTH.set_function(lambda: max((len(c.queue) for c in self.clients.values()), default=0))
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        client = ClientConnection(websocket, self, self.max_queue, self.policy)
+        self.clients[websocket] = client
+        WS_CLIENTS.set(len(self.clients))
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        WS_CLIENTS.set(len(self.clients))
+        if client is not None and not client.closed:
+            client.closed = True
+            client.writer.cancel()
+        if client is not None and client._flush_handle is not None:
+            client._flush_handle.cancel()
+            client._flush_handle = None
+
+    def send(self, websocket: WebSocket, message: str) -> bool:
+        """Queues a frame for one client"""
+        client = self.clients.get(websocket)
+        return client.enqueue(message) if client else False
+
+    def subscribe(self, websocket: WebSocket, message: dict) -> Subscription:
+        """Applies a client's subscribe message; raises ValueError if it is invalid"""
+        subscription = Subscription.from_message(message)
+        client = self.clients.get(websocket)
+        if client:
+            client.subscribe(subscription)
+        return subscription
+
+    def broadcast(self, message: str):
+        """Queues a frame for every client without awaiting any socket"""
+        clients = list(self.clients.values())
+        post = None
+        if any(client.subscription.filtered or client.subscription.coalesce_ms for client in clients):
+            # Parsed once per message, only when some client needs to look inside it
+            try:
+                parsed = json.loads(message)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, dict) and parsed.get("type") == "new_post":
+                post = parsed.get("data") or {}
+
+        for client in clients:
+            if post is None:
+                client.enqueue(message)
+            else:
+                client.offer_post(message, post)
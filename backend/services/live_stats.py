@@ -0,0 +1,107 @@
+import os
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from models import SentimentRollup
+
+# --- Config ---
+# History kept in memory; must cover the longest window asked for (alerts: 5 minutes)
+LIVE_STATS_WINDOW_SECONDS = int(os.getenv("LIVE_STATS_WINDOW_SECONDS", 600))
+
+Key = Tuple[str, str, str]  # (source, label, emotion)
+
+class SlidingWindowStats:
+    """
+    Per-second counts by source, label and emotion over the last `window_seconds`,
+    in a ring buffer fed by the pub/sub updates. Answers "how many of each label in
+    the last N seconds" without touching the database; stale slots are reset lazily
+    when their second comes round again.
+    """
+    def __init__(self, window_seconds: int = LIVE_STATS_WINDOW_SECONDS):
+        self.window_seconds = max(1, window_seconds)
+        self.seconds: List[Optional[int]] = [None] * self.window_seconds
+        self.slots: List[Dict[Key, int]] = [{} for _ in range(self.window_seconds)]
+
+    def add(self, source: str, label: str, emotion: Optional[str] = None, count: int = 1, at: Optional[float] = None):
+        now = int(time.time())
+        second = min(int(at), now) if at is not None else now
+        if second <= now - self.window_seconds:
+            return  # older than anything we keep
+        index = second % self.window_seconds
+        if self.seconds[index] != second:
+            self.seconds[index] = second
+            self.slots[index] = {}
+        key = (source or "", label, emotion or "")
+        self.slots[index][key] = self.slots[index].get(key, 0) + count
+
+    def record(self, payload: str) -> int:
+        """Counts the posts in one worker pub/sub message (single new_post or combined batch)"""
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return 0
+        if not isinstance(message, dict):
+            return 0
+        updates = message.get("data", []) if message.get("type") == "batch" else [message]
+
+        recorded = 0
+        for update in updates:
+            if not isinstance(update, dict) or update.get("type") != "new_post":
+                continue
+            post = update.get("data") or {}
+            sentiment = post.get("sentiment") or {}
+            if sentiment.get("sentiment_label"):
+                self.add(post.get("source"), sentiment["sentiment_label"], sentiment.get("emotion"))
+                recorded += 1
+        return recorded
+
+    def _totals(self, seconds: int, source: Optional[str], field: int) -> Dict[str, int]:
+        now = int(time.time())
+        oldest = now - min(seconds, self.window_seconds)
+        totals: Dict[str, int] = {}
+        for second, slot in zip(self.seconds, self.slots):
+            if second is None or second <= oldest:
+                continue
+            for key, count in slot.items():
+                if source is not None and key[0] != source:
+                    continue
+                if key[field]:
+                    totals[key[field]] = totals.get(key[field], 0) + count
+        return totals
+
+    def label_counts(self, seconds: int, source: Optional[str] = None) -> Dict[str, int]:
+        """{label: count} over the last `seconds` (at most the window)"""
+        return self._totals(seconds, source, 1)
+
+    def emotion_counts(self, seconds: int, source: Optional[str] = None) -> Dict[str, int]:
+        return self._totals(seconds, source, 2)
+
+    async def seed(self, db) -> int:
+        """
+        Refills the window from the minute rollups after a restart, so the first
+        metrics and alert checks don't start from zero. Each minute's counts land on
+        its first second (or the window's oldest kept second), so seeded history is
+        only minute-precise.
+        """
+        now = datetime.utcnow()
+        since = now - timedelta(seconds=self.window_seconds)
+        query = (
+            select(
+                SentimentRollup.bucket,
+                SentimentRollup.source,
+                SentimentRollup.sentiment_label,
+                SentimentRollup.emotion,
+                SentimentRollup.post_count
+            )
+            .where(SentimentRollup.period == "minute")
+            .where(SentimentRollup.bucket >= since.replace(second=0, microsecond=0))
+        )
+        oldest_kept = time.time() - self.window_seconds + 1
+        seeded = 0
+        for bucket, source, label, emotion, count in (await db.execute(query)).all():
+            at = (bucket - datetime(1970, 1, 1)).total_seconds()
+            self.add(source, label, emotion, count, at=max(at, oldest_kept))
+            seeded += count
+        return seeded
@@ -0,0 +1,19 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Tuple
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    """Opaque to clients: url-safe base64 of the last row's (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), post_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for anything encode_cursor didn't produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, post_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
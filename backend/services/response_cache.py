@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from fastapi.encoders import jsonable_encoder
+from prometheus_client import Counter
+
+# --- Config ---
+# Longest an entry is served while no new posts arrive; 0 disables the cache
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 30))
+# Once redis_listener has seen new posts, entries older than this are recomputed
+RESPONSE_CACHE_MAX_STALENESS_SECONDS = float(os.getenv("RESPONSE_CACHE_MAX_STALENESS_SECONDS", 1))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+# Share entries across backend replicas through Redis (the local tier is always used)
+RESPONSE_CACHE_SHARED = os.getenv("RESPONSE_CACHE_SHARED", "false").lower() == "true"
+
+REDIS_KEY_PREFIX = "response_cache:"
+
+CACHE_REQUESTS = Counter(
+    "sentiment_response_cache_requests",
+    "Cached endpoint lookups by result (hit, shared_hit, coalesced, miss)",
+    ["endpoint", "result"]
+)
+
+class ResponseCache:
+    """
+    Response cache for the read-heavy aggregate endpoints. An entry is fresh while
+    it is younger than the TTL and no new posts have arrived since it was computed;
+    after new posts it survives at most max_staleness, so at peak ingest each query
+    runs about once per second per replica instead of once per request. Concurrent
+    misses for the same key share one computation; if its caller is cancelled, a
+    waiting caller takes over.
+    """
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_staleness: float = RESPONSE_CACHE_MAX_STALENESS_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        redis_client=None
+    ):
+        self.ttl = ttl
+        self.max_staleness = min(max_staleness, ttl)
+        self.max_entries = max(1, max_entries)
+        self.redis = redis_client
+        self.last_change = 0.0
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+    def mark_changed(self):
+        """Called for every pub/sub update: new posts make the cached answers stale"""
+        self.last_change = time.time()
+
+    def clear(self):
+        self.entries.clear()
+
+    def _fresh(self, stored_at: float) -> bool:
+        age = time.time() - stored_at
+        if age >= self.ttl:
+            return False
+        return stored_at >= self.last_change or age < self.max_staleness
+
+    async def get_or_compute(self, endpoint: str, params: tuple, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if self.ttl <= 0:
+            return await compute()
+        key = json.dumps([endpoint, *params], default=str)
+
+        entry = self.entries.get(key)
+        if entry and self._fresh(entry[0]):
+            self.entries.move_to_end(key)
+            CACHE_REQUESTS.labels(endpoint, "hit").inc()
+            return entry[1]
+
+        while key in self.inflight:
+            pending = self.inflight[key]
+            try:
+                value = await asyncio.shield(pending)
+                CACHE_REQUESTS.labels(endpoint, "coalesced").inc()
+                return value
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The owner's client went away (its query used that request's session);
+                # the first waiter to wake up computes instead, the rest coalesce onto it
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            stored_at, value, result = await self._load(key, compute)
+            CACHE_REQUESTS.labels(endpoint, result).inc()
+            self._store(key, stored_at, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here, so waiter-less failures aren't logged as unhandled
+            raise
+        finally:
+            del self.inflight[key]
+
+    async def _load(self, key: str, compute) -> Tuple[float, Any, str]:
+        """Shared tier first, then the query; returns (stored_at, value, result label)"""
+        if self.redis is not None:
+            try:
+                cached = await self.redis.get(REDIS_KEY_PREFIX + key)
+                if cached:
+                    stored_at, value = json.loads(cached)
+                    if self._fresh(stored_at):
+                        return stored_at, value, "shared_hit"
+            except Exception as e:
+                print(f"⚠️ Shared response cache unavailable: {e}")
+
+        # Stamped before the query: posts that land while it runs still count as changes
+        stored_at = time.time()
+        value = jsonable_encoder(await compute())
+        if self.redis is not None:
+            try:
+                await self.redis.set(REDIS_KEY_PREFIX + key, json.dumps([stored_at, value]), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                print(f"⚠️ Shared response cache unavailable: {e}")
+        return stored_at, value, "miss"
+
+    def _store(self, key: str, stored_at: float, value: Any):
+        self.entries[key] = (stored_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
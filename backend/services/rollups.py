@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select, func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import SentimentRollup
+
+def naive_utc(ts: datetime) -> datetime:
+    """Rollup buckets are stored as naive UTC; query parameters may carry an offset"""
+    if ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def bucket_start(ts: datetime, period: str) -> datetime:
+    """Same bucketing as the worker's batch_writer: naive UTC start of the minute/hour/day"""
+    ts = naive_utc(ts)
+    if period == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if period == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def distribution_since(
+    db: AsyncSession, since: datetime, source: Optional[str] = None
+) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Label and emotion counts from `since` (to the minute) until now. Minute rollups
+    cover the partial first hour and hour rollups the rest, so a 24h window reads
+    at most ~60 + 24 buckets however much history is kept.
+    """
+    head_start = bucket_start(since, "minute")
+    head_end = bucket_start(since, "hour")
+    if head_end < head_start:
+        head_end += timedelta(hours=1)
+
+    query = (
+        select(SentimentRollup.sentiment_label, SentimentRollup.emotion, func.sum(SentimentRollup.post_count))
+        .where(or_(
+            and_(SentimentRollup.period == "minute",
+                 SentimentRollup.bucket >= head_start,
+                 SentimentRollup.bucket < head_end),
+            and_(SentimentRollup.period == "hour", SentimentRollup.bucket >= head_end)
+        ))
+        .group_by(SentimentRollup.sentiment_label, SentimentRollup.emotion)
+    )
+    if source:
+        query = query.where(SentimentRollup.source == source)
+
+    labels: Dict[str, int] = {}
+    emotions: Dict[str, int] = {}
+    for label, emotion, count in (await db.execute(query)).all():
+        labels[label] = labels.get(label, 0) + count
+        if emotion:
+            emotions[emotion] = emotions.get(emotion, 0) + count
+    return labels, emotions
+
+async def series(
+    db: AsyncSession,
+    period: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    source: Optional[str] = None
+):
+    """(bucket, label, count) rows for one rollup period, oldest first"""
+    query = select(
+        SentimentRollup.bucket,
+        SentimentRollup.sentiment_label,
+        func.sum(SentimentRollup.post_count)
+    ).where(SentimentRollup.period == period)
+
+    if start_date:
+        query = query.where(SentimentRollup.bucket >= bucket_start(start_date, period))
+    if end_date:
+        query = query.where(SentimentRollup.bucket <= naive_utc(end_date))
+    if source:
+        query = query.where(SentimentRollup.source == source)
+
+    query = (
+        query
+        .group_by(SentimentRollup.bucket, SentimentRollup.sentiment_label)
+        .order_by(SentimentRollup.bucket)
+    )
+    return await db.execute(query)
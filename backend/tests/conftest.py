@@ -1,11 +1,18 @@
+import os
+import sys
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from main import app
+from main import app, response_cache
 from database import Base, get_db
 
+# Worker and ingester modules import their siblings flat (each runs from its own directory in Docker).
+# Appended, so backend's own models/database modules still win.
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "worker"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "ingester"))
+
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
 engine = create_async_engine(TEST_DATABASE_URL, echo=False)
@@ -30,6 +37,8 @@ async def client(db_session):
         yield db_session
 
     app.dependency_overrides[get_db] = override_get_db
+    # Every test starts with its own data, so no cached answers from the previous one
+    response_cache.clear()
     
     # --- FIX: Updated for httpx 0.28.0+ ---
     transport = ASGITransport(app=app)
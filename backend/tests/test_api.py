@@ -1,8 +1,10 @@
+import json
 import pytest
 from unittest.mock import patch, AsyncMock, MagicMock
 from datetime import datetime
 from models import SocialMediaPost, SentimentAnalysis, SentimentAlert
 from services.alerting import check_alerts
+from main import split_update
 
 # --- TEST 1: Health Check ---
 @pytest.mark.asyncio
@@ -44,12 +46,52 @@ async def test_get_posts_with_data(client, db_session):
     assert len(data["posts"]) == 1
     assert data["posts"][0]["sentiment"]["label"] == "positive"
 
+# --- TEST 3b: Keyset Pagination ---
+@pytest.mark.asyncio
+async def test_get_posts_cursor_pages_and_latest_analysis(client, db_session):
+    """Cursor pages cover every post once, each with only its latest analysis"""
+    created_at = datetime(2025, 1, 1, 12, 0, 0)
+    for i in range(5):
+        # Two posts share a timestamp per pair: the id tie-breaker keeps pages stable
+        db_session.add(SocialMediaPost(
+            post_id=f"page_{i}", source="twitter", content="Hello",
+            author="user", created_at=created_at.replace(minute=i // 2)
+        ))
+        db_session.add(SentimentAnalysis(
+            post_id=f"page_{i}", model_name="bert", sentiment_label="neutral", confidence_score=0.5
+        ))
+    await db_session.flush()
+    # Re-analysed post: only the newer analysis is returned
+    db_session.add(SentimentAnalysis(
+        post_id="page_4", model_name="bert", sentiment_label="positive", confidence_score=0.9
+    ))
+    await db_session.commit()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        data = (await client.get("/api/posts", params=params)).json()
+        seen += [(p["post_id"], p["sentiment"]["label"]) for p in data["posts"]]
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+
+    assert [post_id for post_id, _ in seen] == ["page_4", "page_3", "page_2", "page_1", "page_0"]
+    assert seen[0] == ("page_4", "positive")
+
+    response = await client.get("/api/posts", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+    first_page = (await client.get("/api/posts", params={"limit": 2})).json()
+    response = await client.get("/api/posts", params={"cursor": first_page["next_cursor"], "offset": 2})
+    assert response.status_code == 400
+
 # --- TEST 4: Aggregation Endpoint (MOCKED FIX) ---
 @pytest.mark.asyncio
 async def test_get_aggregate(client):
     """Test the Time-Series Aggregation Endpoint"""
-    # SQLite doesn't support 'date_trunc', so we mock the DB response.
-    # We trick the API into thinking the DB returned 1 row.
+    # Only the response shaping is under test here, so we mock the DB response.
+    # We trick the API into thinking the rollup query returned 1 row.
     
     class FakeRow:
         def __getitem__(self, idx):
@@ -103,4 +145,13 @@ async def test_alert_logic_trigger(db_session):
     alerts = result.scalars().all()
     
     assert len(alerts) >= 1
-    assert alerts[0].alert_type == "high_negative_ratio"
\ No newline at end of file
+    assert alerts[0].alert_type == "high_negative_ratio"
+
+# --- TEST 6: Combined Worker Updates ---
+def test_split_update_unpacks_batch_messages():
+    """A worker 'batch' message is fanned out as one frame per post"""
+    batch = '{"type": "batch", "data": [{"type": "new_post", "data": {"post_id": "1"}}, {"type": "new_post", "data": {"post_id": "2"}}]}'
+    frames = split_update(batch)
+
+    assert [json.loads(f)["data"]["post_id"] for f in frames] == ["1", "2"]
+    assert split_update('{"type": "new_post"}') == ['{"type": "new_post"}']
@@ -0,0 +1,127 @@
+import json
+import asyncio
+import pytest
+from collections import deque
+from services.broadcast import ConnectionManager, Subscription, coalesce
+
+class FakeWebSocket:
+    """Records frames; a blocked socket never finishes a send, like a stalled tab"""
+    def __init__(self, blocked=False):
+        self.frames = []
+        self.blocked = blocked
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        if self.blocked:
+            await asyncio.Event().wait()
+        self.frames.append(frame)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+def post(i):
+    return json.dumps({"type": "new_post", "data": {"post_id": i}})
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_stall_broadcast_and_drops_oldest():
+    manager = ConnectionManager(max_queue=3, policy="drop_oldest")
+    fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+    await manager.connect(fast)
+    await manager.connect(slow)
+
+    for i in range(10):
+        manager.broadcast(post(i))  # returns immediately for both clients
+        await asyncio.sleep(0.001)  # redis_listener awaits the next pub/sub message
+    await asyncio.sleep(0.01)
+
+    assert [json.loads(f)["data"]["post_id"] for f in fast.frames] == list(range(10))
+    # Frame 0 is stuck in the blocked send; the queue holds only the newest 3
+    slow_client = manager.clients[slow]
+    assert [json.loads(f)["data"]["post_id"] for f in slow_client.queue] == [7, 8, 9]
+    assert slow_client.dropped == 6
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_closes_only_the_slow_client():
+    manager = ConnectionManager(max_queue=2, policy="disconnect")
+    fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+    await manager.connect(fast)
+    await manager.connect(slow)
+
+    for i in range(5):
+        manager.broadcast(post(i))
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(0.01)
+
+    assert manager.active_connections == [fast]
+    assert slow.close_code == 1013
+    assert len(fast.frames) == 5
+
+def test_coalesce_keeps_latest_state_and_newest_posts():
+    metrics = [json.dumps({"type": "metrics_update", "data": {"n": n}}) for n in range(2)]
+    frames = deque([metrics[0], post(1), post(2), metrics[1], post(3)])
+
+    assert list(coalesce(frames, keep_posts=2)) == [post(2), metrics[1], post(3)]
+
+def test_coalesce_keeps_batched_post_frames():
+    def batch(*ids):
+        return json.dumps({"type": "new_posts", "data": [{"post_id": i} for i in ids]})
+    metrics = json.dumps({"type": "metrics_update", "data": {}})
+    frames = deque([batch(1, 2), metrics, batch(3, 4), batch(5), post(6)])
+
+    # Newest frames up to 3 posts: post 6, batch [5], batch [3, 4] (the frame that reaches the limit stays whole)
+    assert list(coalesce(frames, keep_posts=3)) == [metrics, batch(3, 4), batch(5), post(6)]
+    assert list(coalesce(frames, keep_posts=10)) == list(frames)
+
+def labelled_post(i, source, label):
+    return json.dumps({"type": "new_post", "data": {
+        "post_id": f"p{i}", "source": source, "sentiment": {"sentiment_label": label}
+    }})
+
+@pytest.mark.asyncio
+async def test_subscription_filters_posts_but_not_state_frames():
+    manager = ConnectionManager()
+    everything, filtered = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(everything)
+    await manager.connect(filtered)
+    manager.subscribe(filtered, {"type": "subscribe", "sources": ["reddit"], "labels": ["negative"]})
+
+    manager.broadcast(labelled_post(1, "reddit", "negative"))
+    manager.broadcast(labelled_post(2, "reddit", "positive"))
+    manager.broadcast(labelled_post(3, "twitter", "negative"))
+    manager.broadcast(json.dumps({"type": "metrics_update", "data": {}}))
+    await asyncio.sleep(0.01)
+
+    assert len(everything.frames) == 4
+    assert [json.loads(f)["data"].get("post_id") for f in filtered.frames] == ["p1", None]
+
+@pytest.mark.asyncio
+async def test_coalesced_posts_arrive_as_one_array_frame():
+    manager = ConnectionManager()
+    ws = FakeWebSocket()
+    await manager.connect(ws)
+    manager.subscribe(ws, {"type": "subscribe", "coalesce_ms": 20})
+
+    for i in range(5):
+        manager.broadcast(labelled_post(i, "twitter", "neutral"))
+    await asyncio.sleep(0.05)
+
+    assert len(ws.frames) == 1
+    frame = json.loads(ws.frames[0])
+    assert frame["type"] == "new_posts"
+    assert [p["post_id"] for p in frame["data"]] == [f"p{i}" for i in range(5)]
+
+def test_subscription_validation_and_stable_sampling():
+    with pytest.raises(ValueError):
+        Subscription.from_message({"sample_rate": 0})
+    with pytest.raises(ValueError):
+        Subscription.from_message({"sources": "reddit"})
+
+    half = Subscription.from_message({"sample_rate": 0.5})
+    posts = [{"post_id": f"p{i}"} for i in range(1000)]
+    sampled = [p for p in posts if half.matches(p)]
+    assert 400 < len(sampled) < 600
+    # Same post ids, same sample: every tab at the same rate agrees
+    assert sampled == [p for p in posts if Subscription(sample_rate=0.5).matches(p)]
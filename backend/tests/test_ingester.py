@@ -0,0 +1,128 @@
+import gzip
+import json
+import time
+import fakeredis
+from load_generator import target_rate, run_generator
+from replay import replay, load_checkpoint, save_checkpoint
+from post_pool import PostPool, content_pool
+from backpressure import StreamBackpressure
+from partitioning import Partitioner
+
+def test_load_profiles_shape_the_target_rate():
+    assert target_rate("constant", 100, elapsed=42, duration=60) == 100
+    # ramp: 10% of the rate at the start, the full rate from the end of the run
+    assert target_rate("ramp", 100, elapsed=0, duration=10) == 10
+    assert target_rate("ramp", 100, elapsed=10, duration=10) == 100
+    assert target_rate("ramp", 100, elapsed=30, duration=10) == 100
+    # spike: 5x during the last 5s of every 30s period
+    assert target_rate("spike", 100, elapsed=10, duration=60) == 100
+    assert target_rate("spike", 100, elapsed=27, duration=60) == 500
+
+def test_generator_paces_pipelined_xadds_to_the_target_rate():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    sent = run_generator(r, rate=200, duration=0.5, batch_size=20, stream="load_test")
+
+    assert 70 <= sent <= 101
+    assert r.xlen("load_test") == sent
+    post = r.xrange("load_test", count=1)[0][1]
+    assert {"post_id", "source", "author", "content", "created_at"} <= set(post)
+
+def test_post_pool_is_reproducible_and_keeps_the_sentiment_mix():
+    first, second = PostPool(seed=7, authors=50).chunk(300), PostPool(seed=7, authors=50).chunk(300)
+    strip = lambda posts: [{k: v for k, v in post.items() if k != "created_at"} for post in posts]
+    assert strip(first) == strip(second)
+    assert len({post["post_id"] for post in first}) == 300
+
+    contents = content_pool()
+    positive = sum("Highly recommend" in text for text in contents)
+    negative = sum("Do not buy" in text for text in contents)
+    assert positive == negative == len(contents) - positive - negative
+
+def test_replay_streams_gzip_jsonl_and_resumes_from_checkpoint(tmp_path):
+    capture = tmp_path / "capture.jsonl.gz"
+    records = [{"post_id": f"p{i}", "source": "reddit", "author": "a", "content": f"post {i}",
+                "created_at": "2025-01-01T12:00:00Z"} for i in range(5)]
+    records.insert(2, {"post_id": "empty", "content": ""})  # skipped, still counted in the offset
+    with gzip.open(capture, "wt") as f:
+        f.write("\n".join(json.dumps(record) for record in records))
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    assert replay(r, str(capture), batch_size=2, stream="replay_test") == 5
+    assert [data["post_id"] for _, data in r.xrange("replay_test")] == [f"p{i}" for i in range(5)]
+    assert load_checkpoint(f"{capture}.checkpoint") == 6
+
+    # Pretend the first run stopped after four records
+    save_checkpoint(f"{capture}.checkpoint", 4)
+    r.delete("replay_test")
+    assert replay(r, str(capture), stream="replay_test", resume=True) == 2
+    assert [data["post_id"] for _, data in r.xrange("replay_test")] == ["p3", "p4"]
+
+def test_replay_ids_are_stable_and_checkpoint_is_saved_per_batch(tmp_path, monkeypatch):
+    capture = tmp_path / "capture.jsonl"
+    capture.write_text("\n".join(json.dumps({"content": f"no id {i}"}) for i in range(5)))
+    saves = []
+    monkeypatch.setattr("replay.save_checkpoint", lambda path, offset: saves.append(offset))
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    replay(r, str(capture), batch_size=2, stream="first")
+    replay(r, str(capture), batch_size=2, stream="second")
+
+    first = [data["post_id"] for _, data in r.xrange("first")]
+    assert first == [data["post_id"] for _, data in r.xrange("second")]
+    assert len(set(first)) == 5
+    # One save per sent batch (2, 2, 1 records), per run
+    assert saves == [2, 4, 5] * 2
+
+def test_replay_csv_follows_original_pace_scaled_by_speed(tmp_path):
+    capture = tmp_path / "capture.csv"
+    capture.write_text(
+        "post_id,source,author,content,created_at\n"
+        "c1,twitter,a,first,2025-01-01T12:00:00\n"
+        "c2,twitter,b,second,2025-01-01T12:00:02\n"
+    )
+    r = fakeredis.FakeRedis(decode_responses=True)
+
+    started = time.monotonic()
+    assert replay(r, str(capture), speed=10, stream="replay_csv") == 2
+    # 2s apart in the capture, 0.2s apart at 10x
+    assert 0.18 <= time.monotonic() - started < 1.0
+    assert r.xrange("replay_csv")[1][1]["content"] == "second"
+
+def test_backpressure_throttles_on_backlog_and_trims_only_acknowledged_entries():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    ids = [r.xadd("bp_test", {"n": i}) for i in range(10)]
+    r.xgroup_create("bp_test", "fast", id="0")
+    r.xgroup_create("bp_test", "slow", id="0")
+    backpressure = StreamBackpressure(r, stream="bp_test", high_water=8, low_water=4)
+
+    # Nothing delivered yet: backlog is the whole stream and nothing may be trimmed
+    assert backpressure.poll() == 10 and backpressure.throttled
+    assert backpressure.safe_trim_id("bp_test") == "0-0"
+
+    # fast: everything delivered and acked; slow: 6 delivered, 2 of them acked
+    r.xreadgroup("fast", "c", {"bp_test": ">"})
+    r.xack("bp_test", "fast", *ids)
+    r.xreadgroup("slow", "c", {"bp_test": ">"}, count=6)
+    r.xack("bp_test", "slow", ids[0], ids[1])
+
+    # slow's 4 lag + 4 pending keeps the throttle on until the backlog drops to low water
+    assert backpressure.poll() == 8 and backpressure.throttled
+    r.xack("bp_test", "slow", ids[2], ids[3], ids[4], ids[5])
+    assert backpressure.poll() == 4 and not backpressure.throttled
+
+    # Oldest entry still needed by some group: slow's oldest pending, else its last delivered
+    r.xreadgroup("slow", "c", {"bp_test": ">"}, count=1)
+    assert backpressure.safe_trim_id("bp_test") == ids[6]
+    backpressure.trim()
+    assert [msg_id for msg_id, _ in r.xrange("bp_test")][-4:] == ids[6:]
+
+def test_partitioner_hashes_posts_stably_across_stream_keys():
+    partitioner = Partitioner("part_stream", partitions=4, key="source")
+    assert partitioner.keys == [f"part_stream:{i}" for i in range(4)]
+    # Same key, same partition (affinity); crc32 keeps it stable across processes
+    assert partitioner.stream_for({"source": "reddit"}) == partitioner.stream_for({"source": "reddit"})
+    assert Partitioner("part_stream", partitions=1).stream_for({"source": "reddit"}) == "part_stream"
+
+    by_post = Partitioner("part_stream", partitions=4)
+    used = {by_post.stream_for({"post_id": str(i)}) for i in range(200)}
+    assert used == set(by_post.keys)
@@ -1,50 +1,57 @@
 import pytest
 import json
 from unittest.mock import AsyncMock, patch
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 from main import app
 
 @pytest.mark.asyncio
 async def test_full_flow(client, db_session):
     """
     Tests the full flow:
-    1. Ingestion (Simulated via API for simplicity or direct DB insert)
+    1. Ingestion (Simulated via the worker's BatchWriter, which also maintains the rollups)
     2. Retrieval via API
     3. Aggregation
     """
     
-    # 1. Simulate Worker Saving Data (Direct DB Insert)
-    from models import SocialMediaPost, SentimentAnalysis
+    # 1. Simulate Worker Saving Data (same write path as the worker)
+    from batch_writer import BatchWriter
     from datetime import datetime
     
-    post = SocialMediaPost(
-        post_id="integration_test_1",
-        source="twitter",
-        content="Integration test content",
-        author="tester",
-        created_at=datetime.utcnow()
-    )
-    db_session.add(post)
-    
-    analysis = SentimentAnalysis(
-        post_id="integration_test_1",
-        model_name="test_model",
-        sentiment_label="positive",
-        confidence_score=0.95,
-        emotion="joy",
-        analyzed_at=datetime.utcnow()
-    )
-    db_session.add(analysis)
-    await db_session.commit()
+    writer = BatchWriter(sessionmaker(db_session.bind, class_=AsyncSession, expire_on_commit=False))
+    post = {
+        "post_id": "integration_test_1",
+        "source": "twitter",
+        "content": "Integration test content",
+        "author": "tester",
+        "created_at": datetime.utcnow().isoformat()
+    }
+    analysis = {
+        "model_name": "test_model",
+        "sentiment_label": "positive",
+        "confidence_score": 0.95,
+        "emotion": "joy"
+    }
+    other = {**post, "post_id": "integration_test_2", "source": "reddit"}
+    assert await writer.save_batch([(post, analysis), (other, {**analysis, "sentiment_label": "negative", "emotion": "anger"})]) == [True, True]
     
     # 2. Test Posts API
     response = await client.get("/api/posts")
     assert response.status_code == 200
     data = response.json()
     assert len(data['posts']) >= 1
-    assert data['posts'][0]['post_id'] == "integration_test_1"
+    assert {p['post_id'] for p in data['posts']} == {"integration_test_1", "integration_test_2"}
     
-    # 3. Test Distribution API
+    # 3. Test Distribution API (answered from the rollups)
     dist_response = await client.get("/api/sentiment/distribution?hours=24")
     assert dist_response.status_code == 200
     dist_data = dist_response.json()
-    assert dist_data['distribution']['positive'] >= 1
\ No newline at end of file
+    assert dist_data['distribution'] == {"positive": 1, "negative": 1}
+    assert dist_data['emotions'] == {"joy": 1, "anger": 1}
+
+    source_data = (await client.get("/api/sentiment/distribution?hours=24&source=reddit")).json()
+    assert source_data['distribution'] == {"negative": 1}
+
+    # 4. Test Aggregate API (same rollups, per bucket)
+    agg_data = (await client.get("/api/sentiment/aggregate?period=minute")).json()
+    assert sorted((row['sentiment'], row['count']) for row in agg_data['data']) == [("negative", 1), ("positive", 1)]
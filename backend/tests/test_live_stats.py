@@ -0,0 +1,64 @@
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import select
+from models import SentimentRollup, SentimentAlert
+from services.alerting import check_alerts
+from services.live_stats import SlidingWindowStats
+
+def update(label, source="twitter", emotion=None):
+    return {"type": "new_post", "data": {"source": source, "sentiment": {"sentiment_label": label, "emotion": emotion}}}
+
+def test_window_counts_recent_seconds_and_forgets_old_ones():
+    stats = SlidingWindowStats(window_seconds=10)
+    with patch("services.live_stats.time.time", return_value=1000.0):
+        stats.add("twitter", "positive", "joy")
+        stats.add("reddit", "negative", "anger", count=2, at=995)
+        stats.add("reddit", "negative", at=985)  # already outside the window: ignored
+
+        assert stats.label_counts(10) == {"positive": 1, "negative": 2}
+        assert stats.label_counts(3) == {"positive": 1}
+        assert stats.label_counts(10, source="reddit") == {"negative": 2}
+        assert stats.emotion_counts(10) == {"joy": 1, "anger": 2}
+
+    with patch("services.live_stats.time.time", return_value=1008.0):
+        # Second 995 has left the window; its slot is reused for 1005
+        stats.add("twitter", "neutral", at=1005)
+        assert stats.label_counts(10) == {"positive": 1, "neutral": 1}
+
+def test_record_counts_single_and_batched_updates():
+    stats = SlidingWindowStats()
+    batch = {"type": "batch", "data": [update("positive"), update("negative"), {"type": "other"}]}
+
+    assert stats.record(json.dumps(batch)) == 2
+    assert stats.record(json.dumps(update("negative"))) == 1
+    assert stats.record("not json") == 0
+    assert stats.label_counts(60) == {"positive": 1, "negative": 2}
+
+@pytest.mark.asyncio
+async def test_seed_from_minute_rollups(db_session):
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    db_session.add(SentimentRollup(period="minute", bucket=now, source="twitter",
+                                   sentiment_label="negative", emotion="anger", post_count=4, confidence_sum=3.2))
+    db_session.add(SentimentRollup(period="minute", bucket=datetime(2020, 1, 1), source="twitter",
+                                   sentiment_label="positive", emotion="", post_count=9, confidence_sum=9.0))
+    await db_session.commit()
+
+    stats = SlidingWindowStats(window_seconds=600)
+    assert await stats.seed(db_session) == 4
+    assert stats.label_counts(600) == {"negative": 4}
+
+@pytest.mark.asyncio
+async def test_check_alerts_with_live_stats_skips_the_query(db_session):
+    mock_ctx = AsyncMock()
+    mock_ctx.__aenter__.return_value = db_session
+    mock_ctx.__aexit__.return_value = None
+
+    with patch("services.alerting.AsyncSessionLocal", return_value=mock_ctx), \
+         patch.object(db_session, "execute", wraps=db_session.execute) as execute:
+        await check_alerts(stats={"negative": 6, "positive": 1})
+        assert not execute.called
+
+    alerts = (await db_session.execute(select(SentimentAlert))).scalars().all()
+    assert alerts[0].post_count == 7
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+import fakeredis
+from unittest.mock import patch
+from services.response_cache import ResponseCache
+
+class Query:
+    """Counts how often the 'database' is actually hit"""
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"calls": self.calls}
+
+@pytest.mark.asyncio
+async def test_hits_until_new_posts_make_the_entry_stale():
+    cache = ResponseCache(ttl=30, max_staleness=1)
+    query = Query()
+
+    with patch("services.response_cache.time.time", return_value=1000.0):
+        assert await cache.get_or_compute("distribution", (24, None), query) == {"calls": 1}
+        assert await cache.get_or_compute("distribution", (24, None), query) == {"calls": 1}
+        assert await cache.get_or_compute("distribution", (1, None), query) == {"calls": 2}
+
+    with patch("services.response_cache.time.time", return_value=1010.0):
+        # Nothing new: still served from cache well past max_staleness
+        assert await cache.get_or_compute("distribution", (24, None), query) == {"calls": 1}
+        cache.mark_changed()
+        assert await cache.get_or_compute("distribution", (24, None), query) == {"calls": 3}
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_query():
+    cache = ResponseCache(ttl=30)
+    query = Query(delay=0.01)
+
+    results = await asyncio.gather(*[cache.get_or_compute("aggregate", ("hour",), query) for _ in range(10)])
+
+    assert query.calls == 1
+    assert all(result == {"calls": 1} for result in results)
+
+@pytest.mark.asyncio
+async def test_shared_tier_serves_other_replicas():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    replica_a, replica_b = ResponseCache(ttl=30, redis_client=r), ResponseCache(ttl=30, redis_client=r)
+    query = Query()
+
+    await replica_a.get_or_compute("distribution", (24, None), query)
+    assert await replica_b.get_or_compute("distribution", (24, None), query) == {"calls": 1}
+    assert query.calls == 1
+
+@pytest.mark.asyncio
+async def test_cancelled_owner_hands_the_query_to_a_waiter():
+    cache = ResponseCache(ttl=30)
+    query = Query(delay=0.05)
+
+    owner = asyncio.create_task(cache.get_or_compute("aggregate", ("hour",), query))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_compute("aggregate", ("hour",), query)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    owner.cancel()
+
+    results = await asyncio.gather(*waiters)
+    assert owner.cancelled()
+    # One abandoned run, then a single shared retry for every waiter
+    assert query.calls == 2
+    assert all(result == {"calls": 2} for result in results)
@@ -1,3 +1,5 @@
+import json
+import threading
 import pytest
 from unittest.mock import MagicMock, patch
 # You would need to add worker path to pythonpath or move this file, 
@@ -10,10 +12,9 @@ with patch('transformers.pipeline') as mock_pipeline:
 
 @pytest.fixture
 def analyzer():
-    with patch('transformers.pipeline') as mock:
-        # Return mock objects for pipelines
-        mock.return_value = MagicMock()
-        return SentimentAnalyzer()
+    # Each pipeline() call gets its own mock so sentiment and emotion stay separate
+    with patch('worker.sentiment_analyzer.pipeline', side_effect=lambda *args, **kwargs: MagicMock()):
+        return SentimentAnalyzer(max_batch_size=2)
 
 def test_analyze_positive(analyzer):
     # Setup Mock
@@ -28,4 +29,185 @@ def test_analyze_positive(analyzer):
 
 def test_analyze_empty(analyzer):
     result = analyzer.analyze("")
-    assert result is None
\ No newline at end of file
+    assert result is None
+
+def test_analyze_batch_preserves_order(analyzer):
+    # Pipelines echo the text back as the label so we can check the mapping
+    analyzer.sentiment_pipe.side_effect = lambda texts, **kw: [{'label': t.upper(), 'score': 0.9} for t in texts]
+    analyzer.emotion_pipe.side_effect = lambda texts, **kw: [{'label': t, 'score': 0.8} for t in texts]
+
+    texts = ["a much longer post", "", "short", "medium post"]
+    results = analyzer.analyze_batch(texts)
+
+    assert results[1] is None
+    assert [r['sentiment_label'] for i, r in enumerate(results) if i != 1] == [
+        "a much longer post", "short", "medium post"
+    ]
+    # 3 texts with max_batch_size=2 -> two forward passes per model
+    assert analyzer.sentiment_pipe.call_count == 2
+    assert analyzer.emotion_pipe.call_count == 2
+
+def test_analyze_batch_uses_result_cache(analyzer):
+    analyzer.sentiment_pipe.side_effect = lambda texts, **kw: [{'label': 'NEGATIVE', 'score': 0.7} for t in texts]
+    analyzer.emotion_pipe.side_effect = lambda texts, **kw: [{'label': 'anger', 'score': 0.6} for t in texts]
+
+    # Whitespace variants of a repost normalize to the same cache key
+    first = analyzer.analyze_batch(["Worst  phone ever", "Worst phone ever "])
+    second = analyzer.analyze_batch(["Worst phone ever"])
+
+    assert first[0] == first[1] == second[0]
+    assert analyzer.sentiment_pipe.call_count == 1
+    # Deduped on the normalized key, but the model saw the original text
+    assert analyzer.sentiment_pipe.call_args.args[0] == ["Worst  phone ever"]
+    assert analyzer.cache.stats()["hits"] == 1
+
+def test_result_cache_evicts_least_recently_used():
+    from worker.result_cache import ResultCache
+
+    cache = ResultCache(max_entries=2)
+    cache.set("a", "m", {"sentiment_label": "positive"})
+    cache.set("b", "m", {"sentiment_label": "negative"})
+    cache.get("a", "m")
+    cache.set("c", "m", {"sentiment_label": "neutral"})
+
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "m") == {"sentiment_label": "positive"}
+    assert cache.get("a", "other_model") is None
+    assert cache.stats()["evictions"] == 1
+
+def test_quantized_backend_uses_int8_linear_layers():
+    import torch
+    from worker.sentiment_analyzer import build_pipeline
+
+    tiny_model = torch.nn.Sequential(torch.nn.Linear(4, 2))
+    with patch('worker.sentiment_analyzer.AutoModelForSequenceClassification') as auto_model, \
+         patch('worker.sentiment_analyzer.AutoTokenizer'), \
+         patch('worker.sentiment_analyzer.pipeline') as mock_pipeline:
+        auto_model.from_pretrained.return_value = tiny_model
+        build_pipeline("some/model", backend="quantized")
+
+    quantized = mock_pipeline.call_args.kwargs["model"]
+    assert isinstance(quantized[0], torch.ao.nn.quantized.dynamic.Linear)
+
+def test_check_parity_reports_agreement(analyzer):
+    with patch('worker.sentiment_analyzer.pipeline', side_effect=lambda *args, **kwargs: MagicMock()):
+        reference = SentimentAnalyzer()
+    reference.sentiment_pipe.side_effect = lambda texts, **kw: [{'label': 'POSITIVE', 'score': 0.9} for t in texts]
+    reference.emotion_pipe.side_effect = lambda texts, **kw: [{'label': 'joy', 'score': 0.9} for t in texts]
+    # Candidate flips the sentiment of the last sample only
+    analyzer.sentiment_pipe.side_effect = lambda texts, **kw: [
+        {'label': 'POSITIVE' if i < len(texts) - 1 else 'NEGATIVE', 'score': 0.85} for i, t in enumerate(texts)
+    ]
+    analyzer.emotion_pipe.side_effect = lambda texts, **kw: [{'label': 'joy', 'score': 0.9} for t in texts]
+
+    report = analyzer.check_parity(texts=["a", "b", "c", "d"], reference=reference)
+
+    assert report["sentiment_agreement"] == 0.75
+    assert report["emotion_agreement"] == 1.0
+    assert report["max_confidence_drift"] == pytest.approx(0.05)
+
+def test_lazy_emotion_model_loads_on_first_use():
+    with patch('worker.sentiment_analyzer.pipeline', side_effect=lambda *args, **kwargs: MagicMock()) as mock_pipeline:
+        lazy = SentimentAnalyzer(emotion_load_mode="lazy")
+        assert mock_pipeline.call_count == 1
+
+        lazy.warm_up()  # only warms what is loaded
+        assert lazy._emotion_pipe is None
+
+        lazy.sentiment_pipe.side_effect = lambda texts, **kw: [{'label': 'POSITIVE', 'score': 0.9} for t in texts]
+        lazy.emotion_pipe.side_effect = lambda texts, **kw: [{'label': 'joy', 'score': 0.9} for t in texts]
+        assert lazy.analyze("hello")["emotion"] == "joy"
+        assert mock_pipeline.call_count == 2
+
+def test_resolve_model_uses_local_snapshot(tmp_path, monkeypatch):
+    from worker import sentiment_analyzer
+
+    monkeypatch.setattr(sentiment_analyzer, "MODEL_SNAPSHOT_DIR", str(tmp_path))
+    (tmp_path / "org__model").mkdir()
+
+    assert sentiment_analyzer.resolve_model("org/model") == str(tmp_path / "org__model")
+    with pytest.raises(FileNotFoundError):
+        sentiment_analyzer.resolve_model("org/missing")
+
+@pytest.mark.asyncio
+async def test_external_llm_packs_posts_retries_and_falls_back_per_item(analyzer, monkeypatch):
+    import httpx
+    from llm_client import ExternalLLMClient
+
+    monkeypatch.setattr("llm_client.RETRY_BASE_SECONDS", 0)
+    calls = []
+
+    def stand_in(request):
+        calls.append(json.loads(request.content))
+        if len(calls) == 1:
+            return httpx.Response(503)  # transient: retried
+        # The second post in each prompt comes back malformed
+        body = json.dumps([
+            {"sentiment_label": "positive", "confidence_score": 0.9, "emotion": "joy"},
+            {"sentiment_label": "???"}
+        ])
+        return httpx.Response(200, json={"choices": [{"message": {"content": body}}]})
+
+    monkeypatch.setenv("EXTERNAL_LLM_API_KEY", "test-key")
+    analyzer.llm_client = ExternalLLMClient(
+        "test-key", url="http://llm.local/v1/chat/completions", batch_size=2,
+        rate_limit=0, transport=httpx.MockTransport(stand_in)
+    )
+    analyzer.sentiment_pipe.side_effect = lambda texts, **kw: [{'label': 'NEGATIVE', 'score': 0.8} for t in texts]
+    analyzer.emotion_pipe.side_effect = lambda texts, **kw: [{'label': 'anger', 'score': 0.8} for t in texts]
+
+    results = await analyzer.analyze_external_batch(["love it", "hate it"])
+
+    assert len(calls) == 2
+    assert "JSON array with exactly 2 objects" in calls[1]["messages"][0]["content"]
+    assert results[0]["model_name"] == "external_llm"
+    assert results[1]["model_name"] == "distilbert-base-uncased"  # local fallback
+
+def test_cascade_skips_transformers_for_confident_lexicon_hits():
+    with patch('worker.sentiment_analyzer.pipeline', side_effect=lambda *args, **kwargs: MagicMock()):
+        cascade = SentimentAnalyzer(cascade=True)
+    cascade.sentiment_pipe.side_effect = lambda texts, **kw: [{'label': 'POSITIVE', 'score': 0.6} for t in texts]
+    cascade.emotion_pipe.side_effect = lambda texts, **kw: [{'label': 'neutral', 'score': 0.6} for t in texts]
+
+    easy = "I just got the new Pixel 8 and it is amazing! Highly recommend."
+    hard = "Just saw an ad for Netflix. wondering if it's any good."
+    results = cascade.analyze_batch([easy, hard])
+
+    assert results[0]["model_name"] == "lexicon"
+    assert results[0]["sentiment_label"] == "positive" and results[0]["emotion"] == "joy"
+    assert results[1]["model_name"] == "distilbert-base-uncased"
+    assert cascade.sentiment_pipe.call_args.args[0] == [hard]
+
+def test_lexicon_handles_negation_and_mixed_signals():
+    from worker import lexicon
+
+    assert lexicon.analyze("My experience with AWS has been terrible. Do not buy.")["sentiment_label"] == "negative"
+    assert lexicon.analyze("This is not great, honestly I hate it")["sentiment_label"] == "negative"
+    mixed = lexicon.analyze("love the screen, hate the battery, awful speakers")
+    assert mixed["confidence_score"] < 0.85
+    assert lexicon.analyze("Just saw an ad for Tesla Model 3.") is None
+
+@pytest.mark.asyncio
+async def test_external_fallback_runs_on_the_inference_pool(analyzer, monkeypatch):
+    from inference_pool import InferencePool
+
+    monkeypatch.delenv("EXTERNAL_LLM_API_KEY", raising=False)
+    analyzer.sentiment_pipe.side_effect = lambda texts, **kw: [{'label': 'POSITIVE', 'score': 0.9} for t in texts]
+    analyzer.emotion_pipe.side_effect = lambda texts, **kw: [{'label': 'joy', 'score': 0.9} for t in texts]
+    threads = []
+    analyze_batch = analyzer.analyze_batch
+
+    def recording_analyze_batch(*args):
+        threads.append(threading.current_thread().name)
+        return analyze_batch(*args)
+    analyzer.analyze_batch = recording_analyze_batch
+
+    pool = InferencePool(analyzer_factory=lambda: analyzer, mode="thread", concurrency=1, torch_threads=1)
+    analyzer.inference = pool
+    try:
+        results = await analyzer.analyze_external_batch(["love it"])
+    finally:
+        pool.close()
+
+    assert results[0]["sentiment_label"] == "positive"
+    assert threads[0].startswith("inference")
@@ -0,0 +1,361 @@
+import json
+from datetime import datetime, timedelta
+import threading
+import pytest
+import fakeredis
+from unittest.mock import patch
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from prometheus_client import REGISTRY
+from models import SocialMediaPost, SentimentAnalysis, SentimentRollup
+
+# Mocking the pipeline to avoid downloading models during tests
+with patch('transformers.pipeline'):
+    from inference_pool import InferencePool
+    from worker.worker import SentimentWorker, REDIS_STREAM, REDIS_GROUP, DEAD_LETTER_STREAM
+from batch_writer import BatchWriter, prune_minute_rollups
+from rollup_backfill import rebuild
+from batch_controller import AdaptiveBatchController
+from supervisor import Supervisor
+from partition_assignment import PartitionAssignment
+
+class StubAnalyzer:
+    """Records which thread ran inference"""
+    def __init__(self):
+        self.threads = []
+
+    def analyze_batch(self, texts, max_batch_size=None):
+        self.threads.append(threading.current_thread().name)
+        return [{"sentiment_label": "positive", "content": t} for t in texts]
+
+@pytest.fixture
+def stub_pool():
+    pool = InferencePool(analyzer_factory=StubAnalyzer, mode="thread", concurrency=2, torch_threads=1)
+    yield pool
+    pool.close()
+
+@pytest.mark.asyncio
+async def test_inference_pool_runs_off_event_loop(stub_pool):
+    results = await stub_pool.analyze_batch(["a", "b"])
+
+    assert [r["content"] for r in results] == ["a", "b"]
+    assert stub_pool.analyzer.threads[0].startswith("inference")
+
+@pytest.mark.asyncio
+async def test_batch_writer_bulk_insert_is_idempotent_per_post(db_session):
+    writer = BatchWriter(sessionmaker(db_session.bind, class_=AsyncSession, expire_on_commit=False))
+    post = {"post_id": "p1", "source": "twitter", "content": "great", "author": "a",
+            "created_at": "2025-01-01T12:00:00Z"}
+    result = {"model_name": "m", "sentiment_label": "positive", "confidence_score": 0.9, "emotion": "joy"}
+
+    assert await writer.save_batch([(post, result), ({**post, "post_id": "p2"}, result)]) == [True, True]
+    # Redelivered post: ON CONFLICT skips the post, the analysis is still recorded
+    assert await writer.save_batch([(post, result)]) == [True]
+
+    posts = (await db_session.execute(select(func.count(SocialMediaPost.id)))).scalar()
+    analyses = (await db_session.execute(select(func.count(SentimentAnalysis.id)))).scalar()
+    assert (posts, analyses) == (2, 3)
+
+@pytest.mark.asyncio
+async def test_rollups_are_upserted_per_batch_and_rebuilt_from_raw_rows(db_session):
+    session_factory = sessionmaker(db_session.bind, class_=AsyncSession, expire_on_commit=False)
+    writer = BatchWriter(session_factory)
+    post = {"post_id": "r1", "source": "twitter", "content": "great", "author": "a"}
+    joy = {"model_name": "m", "sentiment_label": "positive", "confidence_score": 0.9, "emotion": "joy"}
+    await writer.save_batch([(post, joy), ({**post, "post_id": "r2"}, joy)])
+    await writer.save_batch([({**post, "post_id": "r3"}, {**joy, "sentiment_label": "neutral", "emotion": None})])
+
+    async def rollups():
+        rows = (await db_session.execute(
+            select(SentimentRollup.period, SentimentRollup.sentiment_label, SentimentRollup.emotion,
+                   func.sum(SentimentRollup.post_count))
+            .group_by(SentimentRollup.period, SentimentRollup.sentiment_label, SentimentRollup.emotion)
+        )).all()
+        return sorted(tuple(row) for row in rows)
+
+    incremental = await rollups()
+    # The second batch added onto the same minute/hour/day rows instead of new ones
+    assert [row for row in incremental if row[0] == "day"] == [("day", "neutral", "", 1), ("day", "positive", "joy", 2)]
+
+    assert await rebuild(session_factory, chunk_size=2) == 3
+    assert await rollups() == incremental
+
+@pytest.mark.asyncio
+async def test_minute_rollups_past_retention_are_pruned(db_session):
+    old = datetime.utcnow() - timedelta(hours=200)
+    fresh = datetime.utcnow().replace(second=0, microsecond=0)
+    for period, bucket in (("minute", old.replace(second=0, microsecond=0)), ("hour", old.replace(minute=0, second=0, microsecond=0)), ("minute", fresh)):
+        db_session.add(SentimentRollup(period=period, bucket=bucket, source="twitter", sentiment_label="positive", emotion="", post_count=1, confidence_sum=0.9))
+    await db_session.commit()
+
+    assert await prune_minute_rollups(db_session) == 1
+    await db_session.commit()
+    rows = (await db_session.execute(select(SentimentRollup.period, SentimentRollup.bucket))).all()
+    assert sorted(period for period, _ in rows) == ["hour", "minute"]
+    assert all(bucket == fresh for period, bucket in rows if period == "minute")
+
+@pytest.mark.asyncio
+async def test_batch_writer_falls_back_per_row(db_session):
+    writer = BatchWriter(sessionmaker(db_session.bind, class_=AsyncSession, expire_on_commit=False))
+    good = {"post_id": "ok", "source": "reddit", "content": "fine", "author": "a"}
+    bad = {"post_id": "bad", "source": "reddit", "author": "a"}  # missing content
+    result = {"model_name": "m", "sentiment_label": "neutral", "confidence_score": 0.5}
+
+    assert await writer.save_batch([(good, result), (bad, result)]) == [True, False]
+
+@pytest.mark.asyncio
+async def test_ack_and_publish_uses_one_pipeline(monkeypatch, stub_pool):
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await r.xgroup_create(REDIS_STREAM, REDIS_GROUP, mkstream=True)
+    for i in range(3):
+        await r.xadd(REDIS_STREAM, {"post_id": str(i)})
+    entries = await r.xreadgroup(REDIS_GROUP, "c1", {REDIS_STREAM: ">"}, count=10)
+    msg_ids = [msg_id for msg_id, _ in entries[0][1]]
+
+    pubsub = r.pubsub()
+    await pubsub.subscribe("sentiment_updates")
+    await pubsub.get_message(timeout=1)  # subscribe confirmation
+
+    monkeypatch.setattr("worker.worker.PUBLISH_MODE", "batch")
+    worker = SentimentWorker(redis_client=r, inference=stub_pool)
+    updates = [{"type": "new_post", "data": {"post_id": str(i)}} for i in range(3)]
+    await worker.ack_and_publish(msg_ids, updates)
+
+    assert (await r.xpending(REDIS_STREAM, REDIS_GROUP))["pending"] == 0
+    message = await pubsub.get_message(timeout=1)
+    assert json.loads(message["data"]) == {"type": "batch", "data": updates}
+
+@pytest.mark.asyncio
+async def test_process_batch_records_stage_metrics(db_session):
+    class ScoringAnalyzer:
+        def analyze_batch(self, texts, max_batch_size=None):
+            return [{"sentiment_label": "positive", "confidence_score": 0.9, "emotion": "joy", "model_name": "m"}
+                    if text else None for text in texts]
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await r.xgroup_create(REDIS_STREAM, REDIS_GROUP, mkstream=True)
+    await r.xadd(REDIS_STREAM, {"post_id": "m1", "source": "reddit", "content": "great", "author": "a"})
+    await r.xadd(REDIS_STREAM, {"post_id": "m2", "source": "reddit", "content": "", "author": "a"})
+    entries = await r.xreadgroup(REDIS_GROUP, "c1", {REDIS_STREAM: ">"}, count=10)
+
+    before = {
+        "saved": sample("sentiment_worker_posts_total", outcome="saved"),
+        "skipped": sample("sentiment_worker_posts_total", outcome="skipped"),
+        "db_write": sample("sentiment_worker_stage_seconds_count", stage="db_write"),
+        "batches": sample("sentiment_worker_batch_size_count"),
+        "tier": sample("sentiment_worker_tier_total", tier="m")
+    }
+    pool = InferencePool(analyzer_factory=ScoringAnalyzer, mode="thread", concurrency=1, torch_threads=1)
+    worker = SentimentWorker(
+        redis_client=r, inference=pool,
+        session_factory=sessionmaker(db_session.bind, class_=AsyncSession, expire_on_commit=False)
+    )
+    try:
+        await worker.process_batch(entries[0][1])
+    finally:
+        pool.close()
+
+    assert sample("sentiment_worker_posts_total", outcome="saved") - before["saved"] == 1
+    assert sample("sentiment_worker_posts_total", outcome="skipped") - before["skipped"] == 1
+    assert sample("sentiment_worker_stage_seconds_count", stage="db_write") - before["db_write"] == 1
+    assert sample("sentiment_worker_batch_size_count") - before["batches"] == 1
+    assert sample("sentiment_worker_tier_total", tier="m") - before["tier"] == 1
+
+def test_batch_controller_grows_under_backlog_and_backs_off_over_target():
+    controller = AdaptiveBatchController(min_size=10, max_size=200, target_p99_ms=1000, max_inference_batch=32)
+    controller.update_lag(lag=5000, pending=0)
+    assert controller.block_ms < 5000
+
+    # Fast, full batches with a backlog: the controller widens the read
+    for _ in range(10):
+        controller.record_batch(controller.count, inference_seconds=0.001 * controller.count, total_seconds=0.2)
+    grown = controller.count
+    assert grown > 10
+    assert controller.inference_batch_size == min(grown, 32)
+
+    # Latency blows through the target: multiplicative decrease
+    controller.record_batch(grown, inference_seconds=2.0, total_seconds=3.0)
+    assert controller.count == max(10, int(grown * 0.7))
+
+@pytest.mark.asyncio
+async def test_reclaim_retries_stale_entries_and_dead_letters_poison(monkeypatch, stub_pool):
+    monkeypatch.setattr("worker.worker.RECLAIM_IDLE_MS", 0)
+    monkeypatch.setattr("worker.worker.MAX_DELIVERIES", 2)
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await r.xgroup_create(REDIS_STREAM, REDIS_GROUP, mkstream=True)
+
+    # A dead consumer holds two entries; the first has already been retried once
+    poison_id = await r.xadd(REDIS_STREAM, {"post_id": "poison"})
+    await r.xreadgroup(REDIS_GROUP, "dead", {REDIS_STREAM: ">"}, count=1)
+    await r.xclaim(REDIS_STREAM, REDIS_GROUP, "dead", min_idle_time=0, message_ids=[poison_id])
+    healthy_id = await r.xadd(REDIS_STREAM, {"post_id": "healthy"})
+    await r.xreadgroup(REDIS_GROUP, "dead", {REDIS_STREAM: ">"}, count=1)
+
+    worker = SentimentWorker(redis_client=r, inference=stub_pool)
+    retried = []
+
+    async def fake_process_batch(messages, streams):
+        retried.extend(msg_id for msg_id, _ in messages)
+        await r.xack(streams[0], REDIS_GROUP, *[msg_id for msg_id, _ in messages])
+
+    monkeypatch.setattr(worker, "process_batch", fake_process_batch)
+    assert await worker.reclaim_pending() == 2
+
+    assert retried == [healthy_id]
+    dead = await r.xrange(DEAD_LETTER_STREAM)
+    assert dead[0][1]["original_id"] == poison_id
+    assert (await r.xpending(REDIS_STREAM, REDIS_GROUP))["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_reclaim_acks_entries_trimmed_from_the_stream(monkeypatch, stub_pool):
+    monkeypatch.setattr("worker.worker.RECLAIM_IDLE_MS", 0)
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await r.xgroup_create(REDIS_STREAM, REDIS_GROUP, mkstream=True)
+    msg_id = await r.xadd(REDIS_STREAM, {"post_id": "gone"})
+    await r.xreadgroup(REDIS_GROUP, "dead", {REDIS_STREAM: ">"}, count=1)
+    await r.xdel(REDIS_STREAM, msg_id)  # what MAXLEN trimming does to an unacked entry
+
+    async def redis6_xclaim(*args, message_ids, **kwargs):
+        return [(None, None) for _ in message_ids]  # Redis 6 keeps them pending, returned as nil
+
+    monkeypatch.setattr(r, "xclaim", redis6_xclaim)
+    worker = SentimentWorker(redis_client=r, inference=stub_pool)
+    trimmed = REGISTRY.get_sample_value("sentiment_worker_posts_total", {"outcome": "trimmed"}) or 0
+
+    assert await worker.reclaim_pending() == 0
+    assert (await r.xpending(REDIS_STREAM, REDIS_GROUP))["pending"] == 0
+    assert REGISTRY.get_sample_value("sentiment_worker_posts_total", {"outcome": "trimmed"}) == trimmed + 1
+
+@pytest.mark.asyncio
+async def test_close_releases_the_external_llm_client(stub_pool):
+    import httpx
+    from llm_client import ExternalLLMClient
+
+    worker = SentimentWorker(redis_client=fakeredis.FakeAsyncRedis(), inference=stub_pool)
+    client = ExternalLLMClient("key", transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    stub_pool.analyzer.llm_client = client
+
+    await worker.close()
+
+    assert client.client.is_closed
+    assert stub_pool.analyzer.llm_client is None
+
+@pytest.mark.asyncio
+async def test_process_mode_external_path_loads_no_models_in_the_parent(monkeypatch):
+    from sentiment_analyzer import ExternalAnalyzer
+
+    class ProcessPool:
+        """Like InferencePool in process mode: the analyzers live in child processes"""
+        analyzer = None
+        concurrency = 1
+
+        async def analyze_batch(self, texts, max_batch_size=None):
+            return [{"sentiment_label": "neutral", "content": t} for t in texts]
+
+    monkeypatch.setattr("worker.worker.USE_EXTERNAL_LLM", True)
+    monkeypatch.delenv("EXTERNAL_LLM_API_KEY", raising=False)
+    worker = SentimentWorker(redis_client=fakeredis.FakeAsyncRedis(), inference=ProcessPool())
+
+    assert type(worker.analyzer) is ExternalAnalyzer
+    assert (await worker.analyzer.analyze_external_batch(["meh"]))[0]["content"] == "meh"
+
+@pytest.mark.asyncio
+async def test_reclaim_skips_batches_this_consumer_is_still_processing(monkeypatch, stub_pool):
+    monkeypatch.setattr("worker.worker.RECLAIM_IDLE_MS", 0)
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await r.xgroup_create(REDIS_STREAM, REDIS_GROUP, mkstream=True)
+    worker = SentimentWorker(redis_client=r, inference=stub_pool, consumer_name="slow")
+
+    msg_id = await r.xadd(REDIS_STREAM, {"post_id": "slow"})
+    await r.xreadgroup(REDIS_GROUP, "slow", {REDIS_STREAM: ">"}, count=1)
+    worker.in_flight_ids.add((REDIS_STREAM, msg_id))  # a batch stuck in a slow model call
+
+    assert await worker.reclaim_pending() == 0
+    pending = await r.xpending_range(REDIS_STREAM, REDIS_GROUP, min="-", max="+", count=10)
+    assert pending[0]["times_delivered"] == 1
+
+@pytest.mark.asyncio
+async def test_partitions_are_discovered_balanced_and_acked_per_stream(stub_pool):
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await r.set("part_test:partitions", 3)  # announced by the ingester
+    c1, c2 = PartitionAssignment(r, "part_test", "c1"), PartitionAssignment(r, "part_test", "c2")
+
+    assert await c1.refresh()  # layout changed from the 1-partition default
+    assert c1.assigned == ["part_test:0", "part_test:1", "part_test:2"]
+    await c2.refresh()
+    await c1.refresh()
+    assert (c1.assigned, c2.assigned) == (["part_test:0", "part_test:2"], ["part_test:1"])
+
+    # c2 leaves: c1 takes everything over on its next heartbeat
+    await c2.leave()
+    await c1.refresh()
+    assert c1.assigned == c1.keys
+
+    # One batch spanning two partitions is acked on each partition's own key
+    worker = SentimentWorker(redis_client=r, inference=stub_pool)
+    ids = {}
+    for stream in ("part_test:0", "part_test:1"):
+        await r.xgroup_create(stream, REDIS_GROUP, mkstream=True)
+        ids[stream] = await r.xadd(stream, {"post_id": stream})
+    entries = await r.xreadgroup(REDIS_GROUP, "c1", {"part_test:0": ">", "part_test:1": ">"})
+    assert sorted(stream for stream, _ in entries) == ["part_test:0", "part_test:1"]
+
+    await worker.ack_and_publish(list(ids.values()), [], list(ids.keys()))
+    for stream in ids:
+        assert (await r.xpending(stream, REDIS_GROUP))["pending"] == 0
+
+def test_supervisor_forks_unique_consumers_and_restarts(tmp_path, monkeypatch):
+    monkeypatch.setattr("supervisor.RESTART_BACKOFF_SECONDS", 0)
+    log = tmp_path / "children.log"
+
+    def child_main(analyzer, consumer_name, torch_threads):
+        # Children share the parent's analyzer object and exit immediately
+        with open(log, "a") as f:
+            f.write(f"{consumer_name} {analyzer['loaded']} {torch_threads}\n")
+
+    supervisor = Supervisor(child_main, processes=2, torch_threads=1, analyzer_factory=lambda: {"loaded": "yes"})
+    supervisor.start()
+    supervisor.reap_once()
+    supervisor.reap_once()
+    # Let the restarted children finish, without restarting them again
+    supervisor.stopping = True
+    while supervisor.children:
+        supervisor.reap_once()
+
+    lines = log.read_text().split("\n")[:-1]
+    names = {line.split()[0] for line in lines}
+    assert len(lines) == 4 and len(names) == 2
+    assert all(line.endswith("yes 1") for line in lines)
+    assert supervisor.restarts == 2
+
+@pytest.mark.asyncio
+async def test_keys_left_behind_by_a_resize_are_read_until_drained():
+    from partitioning import Partitioner
+
+    server = fakeredis.FakeServer()
+    sync_r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    r = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    # Single-key layout with an entry nobody has read yet, then a resize to 2 partitions
+    Partitioner("resize_test", partitions=1).announce(sync_r)
+    await r.xgroup_create("resize_test", REDIS_GROUP, id="0", mkstream=True)
+    await r.xadd("resize_test", {"post_id": "old"})
+    Partitioner("resize_test", partitions=2).announce(sync_r)
+
+    c1 = PartitionAssignment(r, "resize_test", "c1")
+    await c1.refresh()
+    assert c1.keys == ["resize_test:0", "resize_test:1", "resize_test"]
+    assert await c1.release_drained() == []
+    assert await r.exists("resize_test")
+
+    entries = await r.xreadgroup(REDIS_GROUP, "c1", {"resize_test": ">"})
+    await r.xack("resize_test", REDIS_GROUP, entries[0][1][0][0])
+    assert await c1.release_drained() == ["resize_test"]
+    assert not await r.exists("resize_test")
+    assert c1.keys == c1.assigned == ["resize_test:0", "resize_test:1"]
+    assert not await c1.refresh()
+
@@ -34,19 +34,18 @@ export default function Dashboard() {
     ws.onmessage = (event) => {
       const message = JSON.parse(event.data);
 
-      if (message.type === "new_post") {
-        const newPost = message.data;
-        setPosts((prev) => [newPost, ...prev].slice(0, 50));
+      // "new_posts" is the coalesced form: an array of posts, oldest first
+      if (message.type === "new_post" || message.type === "new_posts") {
+        const newPosts = message.type === "new_post" ? [message.data] : message.data;
+        setPosts((prev) => [...newPosts.slice().reverse(), ...prev].slice(0, 50));
 
         setStats((prev) => {
-          const label = newPost.sentiment.sentiment_label;
-          return {
-            total_posts: prev.total_posts + 1,
-            distribution: {
-              ...prev.distribution,
-              [label]: (prev.distribution[label] || 0) + 1,
-            },
-          };
+          const distribution = { ...prev.distribution };
+          newPosts.forEach((post) => {
+            const label = post.sentiment.sentiment_label;
+            distribution[label] = (distribution[label] || 0) + 1;
+          });
+          return { total_posts: prev.total_posts + newPosts.length, distribution };
         });
       }
 
@@ -0,0 +1,138 @@
+import os
+import time
+from typing import Optional
+import redis
+from ingester import STREAM_NAME
+from partitioning import STREAM_PARTITIONS, partition_keys
+from ingester_metrics import (
+    CONSUMER_LAG, CONSUMER_PENDING, BACKLOG, THROTTLED, THROTTLED_SECONDS, TRIMMED
+)
+
+# --- Config ---
+# Backlog = worst group's lag (undelivered) + pending (unacknowledged) entries; 0 = never throttle
+BACKPRESSURE_HIGH_WATER = int(os.getenv("BACKPRESSURE_HIGH_WATER", 50000))
+# Ingestion resumes once the backlog is back under this (hysteresis, so it doesn't flap)
+BACKPRESSURE_LOW_WATER = int(os.getenv("BACKPRESSURE_LOW_WATER", 25000))
+BACKPRESSURE_POLL_SECONDS = float(os.getenv("BACKPRESSURE_POLL_SECONDS", 1))
+# How often fully acknowledged entries are trimmed from the stream head
+TRIM_INTERVAL_SECONDS = float(os.getenv("TRIM_INTERVAL_SECONDS", 10))
+# Trickle mode keeps generating while throttled and holds up to this many posts in memory
+BACKPRESSURE_BUFFER_SIZE = int(os.getenv("BACKPRESSURE_BUFFER_SIZE", 10000))
+
+def _stream_id(entry_id: str):
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+class StreamBackpressure:
+    """
+    Replaces blind MAXLEN trimming. Polls XINFO GROUPS for every consumer group's
+    lag and pending count (summed over the stream's partitions), reports when the
+    ingester should hold posts back, and trims (XTRIM MINID) each partition only up
+    to entries that every group has delivered and acknowledged.
+    """
+    def __init__(
+        self,
+        r,
+        stream: str = STREAM_NAME,
+        partitions: int = STREAM_PARTITIONS,
+        high_water: int = BACKPRESSURE_HIGH_WATER,
+        low_water: int = BACKPRESSURE_LOW_WATER,
+        poll_seconds: float = BACKPRESSURE_POLL_SECONDS,
+        trim_interval: float = TRIM_INTERVAL_SECONDS
+    ):
+        self.r = r
+        self.streams = partition_keys(stream, partitions)
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+        self.poll_seconds = poll_seconds
+        # 0 = never trim (e.g. in load-generator children; the parent trims)
+        self.trim_interval = trim_interval
+        self.backlog = 0
+        self.throttled = False
+        self._last_poll = self._last_trim = float("-inf")
+
+    def poll(self) -> int:
+        """Refreshes the backlog and throttle state from the consumer groups"""
+        lags, pending, unread = {}, {}, 0
+        for stream in self.streams:
+            groups = self._groups(stream)
+            if not groups:
+                # No workers have registered on this partition yet: nothing has been read
+                unread += self.r.xlen(stream)
+            for group in groups:
+                # lag is None when Redis cannot derive it; the stream length is a safe upper bound
+                lag = group.get("lag")
+                if lag is None:
+                    lag = self.r.xlen(stream)
+                lags[group["name"]] = lags.get(group["name"], 0) + lag
+                pending[group["name"]] = pending.get(group["name"], 0) + group["pending"]
+
+        for name in lags:
+            CONSUMER_LAG.labels(name).set(lags[name])
+            CONSUMER_PENDING.labels(name).set(pending[name])
+        backlog = unread + max((lags[name] + pending[name] for name in lags), default=0)
+
+        self.backlog = backlog
+        if self.high_water and backlog >= self.high_water:
+            self.throttled = True
+        elif backlog <= self.low_water:
+            self.throttled = False
+        BACKLOG.set(backlog)
+        THROTTLED.set(int(self.throttled))
+        self._last_poll = time.monotonic()
+        return backlog
+
+    def _groups(self, stream: str) -> list:
+        try:
+            return self.r.xinfo_groups(stream)
+        except redis.ResponseError:
+            return []  # stream not created yet
+
+    def safe_trim_id(self, stream: str) -> Optional[str]:
+        """Oldest entry some group still needs: its oldest pending entry, else its last delivered one"""
+        groups = self._groups(stream)
+        if not groups:
+            return None
+
+        needed = []
+        for group in groups:
+            if group["pending"]:
+                needed.append(self.r.xpending(stream, group["name"])["min"])
+            else:
+                needed.append(group["last-delivered-id"])
+        return min(needed, key=_stream_id)
+
+    def trim(self) -> int:
+        """XTRIM MINID ~ to the safe point of each partition; approximate, so Redis only drops whole nodes"""
+        self._last_trim = time.monotonic()
+        trimmed = 0
+        for stream in self.streams:
+            min_id = self.safe_trim_id(stream)
+            if min_id and min_id != "0-0":
+                trimmed += self.r.xtrim(stream, minid=min_id, approximate=True)
+        TRIMMED.inc(trimmed)
+        return trimmed
+
+    def tick(self):
+        """Polls and trims when their intervals are due; cheap enough to call before every send"""
+        now = time.monotonic()
+        if now - self._last_poll >= self.poll_seconds:
+            self.poll()
+        if self.trim_interval and now - self._last_trim >= self.trim_interval:
+            self.trim()
+
+    def wait(self) -> float:
+        """Blocks while the backlog is above the high-water mark; returns the seconds waited"""
+        self.tick()
+        if not self.throttled:
+            return 0.0
+
+        started = time.monotonic()
+        print(f"⏸️ Backlog {self.backlog} >= {self.high_water}: pausing ingestion")
+        while self.throttled:
+            time.sleep(self.poll_seconds)
+            self.tick()
+        waited = time.monotonic() - started
+        THROTTLED_SECONDS.inc(waited)
+        print(f"▶️ Backlog down to {self.backlog}: resuming after {waited:.1f}s")
+        return waited
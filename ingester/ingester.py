@@ -4,6 +4,7 @@ import json
 import random
 import uuid
 import redis
+from collections import deque
 from datetime import datetime
 from faker import Faker
 
@@ -11,17 +12,24 @@ from faker import Faker
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 STREAM_NAME = os.getenv("REDIS_STREAM_NAME", "social_posts_stream")
+# trickle = one post every 0.5-2s (demo), load = high-rate generator (see load_generator.py),
+# replay = stream posts from a capture file (see replay.py)
+INGEST_MODE = os.getenv("INGEST_MODE", "trickle")
 
-# 2. Initialize Faker and Redis
+# 2. Initialize Faker
 fake = Faker()
-try:
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-    # Test connection
-    r.ping()
-    print(f"Connected to Redis at {REDIS_HOST}:{REDIS_PORT}")
-except Exception as e:
-    print(f"Failed to connect to Redis: {e}")
-    exit(1)
+
+def connect_redis():
+    """Connects to Redis (done at startup, not import, so generate_post can be reused)"""
+    try:
+        client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        # Test connection
+        client.ping()
+        print(f"Connected to Redis at {REDIS_HOST}:{REDIS_PORT}")
+        return client
+    except Exception as e:
+        print(f"Failed to connect to Redis: {e}")
+        exit(1)
 
 # 3. Data Templates (to make it look real)
 PRODUCTS = ["iPhone 16", "Tesla Model 3", "Netflix", "ChatGPT", "Pixel 8", "AWS"]
@@ -52,18 +60,46 @@ def generate_post():
         "created_at": datetime.utcnow().isoformat()
     }
 
-def start_ingestion():
+def start_ingestion(r):
     """Main loop to publish posts"""
-    print(f"Starting ingestion to stream: {STREAM_NAME}...")
+    from backpressure import StreamBackpressure, BACKPRESSURE_BUFFER_SIZE
+    from ingester_metrics import BUFFERED, start_metrics_server
+    from partitioning import Partitioner
+
+    partitioner = Partitioner()
+    partitioner.announce(r)
+    print(f"Starting ingestion to stream: {STREAM_NAME} ({len(partitioner.keys)} partitions)...")
+    start_metrics_server()
+    # Trims only what every consumer group has acknowledged, instead of a blind MAXLEN
+    backpressure = StreamBackpressure(r)
+    buffer = deque()
     
     while True:
         try:
             # Generate a post
             post_data = generate_post()
-            
+
+            backpressure.tick()
+            if backpressure.throttled and len(buffer) < BACKPRESSURE_BUFFER_SIZE:
+                # Workers are behind: hold the post until the backlog drains
+                buffer.append(post_data)
+                BUFFERED.set(len(buffer))
+                time.sleep(random.uniform(0.5, 2.0))
+                continue
+            # Buffer full: block until the backlog drains
+            backpressure.wait()
+
+            if buffer:
+                pipe = r.pipeline(transaction=False)
+                for buffered in buffer:
+                    pipe.xadd(partitioner.stream_for(buffered), buffered)
+                pipe.execute()
+                print(f"Published {len(buffer)} buffered posts")
+                buffer.clear()
+                BUFFERED.set(0)
+
             # Publish to Redis Stream
-            # maxlen=1000 prevents Redis from filling up memory forever
-            r.xadd(STREAM_NAME, post_data, maxlen=10000)
+            r.xadd(partitioner.stream_for(post_data), post_data)
             
             print(f"Published post: {post_data['post_id']} ({post_data['source']})")
             
@@ -77,4 +113,11 @@ def start_ingestion():
 if __name__ == "__main__":
     # Wait for Redis to be ready (simple retry)
     time.sleep(5) 
-    start_ingestion()
\ No newline at end of file
+    if INGEST_MODE == "load":
+        from load_generator import run_load
+        run_load()
+    elif INGEST_MODE == "replay":
+        from replay import main as run_replay
+        run_replay()
+    else:
+        start_ingestion(connect_redis())
\ No newline at end of file
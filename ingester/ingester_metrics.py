@@ -0,0 +1,52 @@
+import os
+from prometheus_client import Counter, Gauge, start_http_server
+
+# --- Config ---
+# 0 disables the endpoint
+INGESTER_METRICS_PORT = int(os.getenv("INGESTER_METRICS_PORT", 9101))
+
+CONSUMER_LAG = Gauge(
+    "sentiment_ingester_consumer_lag",
+    "Stream entries not yet delivered to each consumer group",
+    ["group"]
+)
+CONSUMER_PENDING = Gauge(
+    "sentiment_ingester_consumer_pending",
+    "Entries delivered to each consumer group but not acknowledged",
+    ["group"]
+)
+BACKLOG = Gauge(
+    "sentiment_ingester_backlog",
+    "Worst consumer group's undelivered + unacknowledged entries (the backpressure signal)"
+)
+THROTTLED = Gauge(
+    "sentiment_ingester_throttled",
+    "1 while the ingester holds posts back because the backlog passed the high-water mark"
+)
+BUFFERED = Gauge(
+    "sentiment_ingester_buffered_posts",
+    "Posts generated while throttled and held in memory"
+)
+THROTTLED_SECONDS = Counter(
+    "sentiment_ingester_throttled_seconds",
+    "Time spent waiting for the consumer groups to catch up"
+)
+TRIMMED = Counter(
+    "sentiment_ingester_trimmed_entries",
+    "Entries removed by XTRIM MINID after every group had acknowledged them"
+)
+
+_started = False
+
+def start_metrics_server(port: int = INGESTER_METRICS_PORT):
+    """Serves /metrics on a background thread; later calls are no-ops"""
+    global _started
+    if _started or port <= 0:
+        return
+    try:
+        start_http_server(port)
+    except OSError as e:
+        print(f"⚠️ Metrics server not started on :{port}: {e}")
+        return
+    _started = True
+    print(f"📈 Metrics on :{port}/metrics")
@@ -0,0 +1,190 @@
+"""
+High-rate load mode for capacity testing.
+
+Paces pipelined XADD batches to a target rate that follows a constant, ramp or
+spike profile, optionally split across several generator processes, and reports
+the rate actually achieved. Generators pause while the consumer groups' backlog is
+above the high-water mark (BACKPRESSURE_HIGH_WATER=0 drives the workers past it).
+
+    python load_generator.py --rate 2000 --profile ramp --duration 120 --processes 4
+"""
+import os
+import time
+import argparse
+import multiprocessing
+from multiprocessing.connection import wait
+from typing import Optional
+import redis
+from ingester import REDIS_HOST, REDIS_PORT, STREAM_NAME
+from post_pool import POST_GENERATOR, POST_SEED, make_post_source
+from backpressure import StreamBackpressure, BACKPRESSURE_POLL_SECONDS
+from ingester_metrics import start_metrics_server
+from partitioning import Partitioner
+
+# --- Config ---
+LOAD_RATE = float(os.getenv("LOAD_RATE", 1000))  # posts/sec, all processes together
+LOAD_PROFILE = os.getenv("LOAD_PROFILE", "constant")
+LOAD_DURATION = float(os.getenv("LOAD_DURATION", 60))  # seconds, 0 = until stopped
+LOAD_PROCESSES = int(os.getenv("LOAD_PROCESSES", 1))
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", 100))  # XADDs per pipeline round trip
+# ramp: grows from RAMP_START_FRACTION of the rate to the full rate over the run
+RAMP_START_FRACTION = 0.1
+# spike: SPIKE_MULTIPLIER x rate for SPIKE_SECONDS out of every SPIKE_PERIOD_SECONDS
+SPIKE_MULTIPLIER = float(os.getenv("LOAD_SPIKE_MULTIPLIER", 5))
+SPIKE_SECONDS = float(os.getenv("LOAD_SPIKE_SECONDS", 5))
+SPIKE_PERIOD_SECONDS = float(os.getenv("LOAD_SPIKE_PERIOD_SECONDS", 30))
+REPORT_SECONDS = 5.0
+
+PROFILES = ("constant", "ramp", "spike")
+
+def target_rate(profile: str, rate: float, elapsed: float, duration: float) -> float:
+    """Target posts/sec at `elapsed` seconds into the run"""
+    if profile == "ramp":
+        # Without a fixed duration, ramp over one minute and then hold
+        span = duration or 60.0
+        progress = min(elapsed / span, 1.0)
+        return rate * (RAMP_START_FRACTION + (1 - RAMP_START_FRACTION) * progress)
+    if profile == "spike":
+        in_spike = elapsed % SPIKE_PERIOD_SECONDS >= SPIKE_PERIOD_SECONDS - SPIKE_SECONDS
+        return rate * SPIKE_MULTIPLIER if in_spike else rate
+    return rate
+
+def run_generator(
+    r,
+    rate: float,
+    profile: str = "constant",
+    duration: float = LOAD_DURATION,
+    batch_size: int = LOAD_BATCH_SIZE,
+    sent_counter=None,
+    stream: str = STREAM_NAME,
+    posts=None,
+    backpressure: Optional[StreamBackpressure] = None
+) -> int:
+    """
+    Sends posts at `rate` (shaped by `profile`) until `duration` elapses.
+    Posts owed by the profile accumulate as credit and go out in pipelined batches,
+    so a slow round trip is caught up on instead of lowering the rate.
+    """
+    posts = posts or make_post_source()
+    partitioner = Partitioner(stream)
+    started = time.monotonic()
+    last = started
+    credit = 0.0
+    sent = 0
+
+    while True:
+        now = time.monotonic()
+        elapsed = now - started
+        if duration and elapsed >= duration:
+            break
+        credit += target_rate(profile, rate, elapsed, duration) * (now - last)
+        last = now
+
+        if backpressure and backpressure.wait():
+            # Posts owed while paused are dropped, not sent as a burst on resume
+            credit, last = 0.0, time.monotonic()
+            continue
+
+        # Batches grow with the rate: whatever accrued during the previous round trip
+        count = min(int(credit), batch_size)
+        if count == 0:
+            time.sleep(min(1 / (target_rate(profile, rate, elapsed, duration) or 1.0), 0.05))
+            continue
+
+        pipe = r.pipeline(transaction=False)
+        for post in posts.chunk(count):
+            pipe.xadd(partitioner.stream_for(post), post)
+        pipe.execute()
+        credit -= count
+        sent += count
+        if sent_counter is not None:
+            with sent_counter.get_lock():
+                sent_counter.value += count
+
+    return sent
+
+def _generator_process(rate, profile, duration, batch_size, sent_counter, generator, seed):
+    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    posts = make_post_source(generator, seed)
+    # Children only throttle; the parent trims and exports the gauges
+    backpressure = StreamBackpressure(r, trim_interval=0)
+    try:
+        run_generator(r, rate, profile, duration, batch_size, sent_counter, posts=posts, backpressure=backpressure)
+    except KeyboardInterrupt:
+        pass
+
+def run_load(
+    rate: float = LOAD_RATE,
+    profile: str = LOAD_PROFILE,
+    duration: float = LOAD_DURATION,
+    processes: int = LOAD_PROCESSES,
+    batch_size: int = LOAD_BATCH_SIZE,
+    generator: str = POST_GENERATOR,
+    seed: Optional[int] = int(POST_SEED) if POST_SEED else None
+) -> dict:
+    """Splits the rate over `processes` generators and reports target vs achieved rate"""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown load profile {profile!r}, expected one of {PROFILES}")
+    processes = max(1, processes)
+    sent_counter = multiprocessing.Value("q", 0)
+    workers = [
+        multiprocessing.Process(
+            target=_generator_process,
+            # Distinct seeds per process, or every generator would send the same post_ids
+            args=(rate / processes, profile, duration, batch_size, sent_counter,
+                  generator, None if seed is None else seed + index),
+            daemon=True
+        )
+        for index in range(processes)
+    ]
+    print(f"🚀 Load mode: {rate:.0f} posts/s {profile} for {duration or '∞'}s, "
+          f"{processes} process(es), batches of {batch_size} -> {STREAM_NAME} x{len(Partitioner().keys)}")
+
+    start_metrics_server()
+    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    Partitioner().announce(r)
+    backpressure = StreamBackpressure(r)
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+
+    last_sent, last_time = 0, started
+    try:
+        while any(worker.is_alive() for worker in workers):
+            # Wakes early when a generator exits, so short runs report promptly
+            wait([worker.sentinel for worker in workers], BACKPRESSURE_POLL_SECONDS)
+            backpressure.tick()
+            now, sent = time.monotonic(), sent_counter.value
+            if now - last_time < REPORT_SECONDS and all(worker.is_alive() for worker in workers):
+                continue
+            print(f"📤 target {target_rate(profile, rate, now - started, duration):.0f}/s, "
+                  f"achieved {(sent - last_sent) / (now - last_time):.0f}/s ({sent} total, "
+                  f"backlog {backpressure.backlog}{', throttled' if backpressure.throttled else ''})")
+            last_sent, last_time = sent, now
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    for worker in workers:
+        worker.join()
+
+    elapsed = time.monotonic() - started
+    summary = {"sent": sent_counter.value, "seconds": round(elapsed, 2),
+               "achieved_rate": round(sent_counter.value / elapsed, 1)}
+    print(f"🏁 Sent {summary['sent']} posts in {summary['seconds']}s ({summary['achieved_rate']} posts/s)")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=LOAD_RATE, help="target posts/sec (all processes)")
+    parser.add_argument("--profile", choices=PROFILES, default=LOAD_PROFILE)
+    parser.add_argument("--duration", type=float, default=LOAD_DURATION, help="seconds, 0 = until stopped")
+    parser.add_argument("--processes", type=int, default=LOAD_PROCESSES)
+    parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE)
+    parser.add_argument("--generator", choices=["pool", "faker"], default=POST_GENERATOR)
+    parser.add_argument("--seed", type=int, default=int(POST_SEED) if POST_SEED else None,
+                        help="reproducible posts (pool generator)")
+    args = parser.parse_args()
+    run_load(args.rate, args.profile, args.duration, args.processes, args.batch_size, args.generator, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import zlib
+from typing import List
+from ingester import STREAM_NAME
+
+# --- Config ---
+# 1 = the single STREAM_NAME key; N = STREAM_NAME:0 .. STREAM_NAME:N-1
+STREAM_PARTITIONS = int(os.getenv("STREAM_PARTITIONS", 1))
+# Post field hashed to pick the partition: post_id spreads evenly, source/author keep affinity
+PARTITION_KEY = os.getenv("PARTITION_KEY", "post_id")
+
+def partition_keys(stream: str, partitions: int) -> List[str]:
+    if partitions <= 1:
+        return [stream]
+    return [f"{stream}:{index}" for index in range(partitions)]
+
+class Partitioner:
+    """Maps each post to one of N stream keys by a stable hash of one of its fields"""
+    def __init__(self, stream: str = STREAM_NAME, partitions: int = STREAM_PARTITIONS, key: str = PARTITION_KEY):
+        self.stream = stream
+        self.key = key
+        self.keys = partition_keys(stream, partitions)
+
+    def stream_for(self, post: dict) -> str:
+        if len(self.keys) == 1:
+            return self.keys[0]
+        # crc32, not hash(): Python's str hash is salted per process
+        return self.keys[zlib.crc32(str(post.get(self.key, "")).encode()) % len(self.keys)]
+
+    def announce(self, r):
+        """
+        Publishes the partition count, so workers discover the layout without their own
+        config. Keys a resize leaves behind are listed in {stream}:retired; workers keep
+        reading them until every group has drained them.
+        """
+        retired_key = f"{self.stream}:retired"
+        previous = r.get(f"{self.stream}:partitions")
+        if previous is not None and int(previous) != len(self.keys):
+            retired = [key for key in partition_keys(self.stream, int(previous)) if key not in self.keys]
+            if retired:
+                r.sadd(retired_key, *retired)
+                print(f"🔀 Partitions {previous} -> {len(self.keys)}: draining {len(retired)} old key(s)")
+        # Keys in use again after resizing back are live, not draining
+        r.srem(retired_key, *self.keys)
+        r.set(f"{self.stream}:partitions", len(self.keys))
@@ -0,0 +1,74 @@
+import os
+import uuid
+import random
+from datetime import datetime
+from typing import Iterator, List, Optional
+from faker import Faker
+from ingester import PRODUCTS, POSITIVE_ADJECTIVES, NEGATIVE_ADJECTIVES, generate_post
+
+# --- Config ---
+# pool = pre-generated authors/contents (fast, reproducible with a seed), faker = generate_post per post
+POST_GENERATOR = os.getenv("POST_GENERATOR", "pool")
+POST_SEED = os.getenv("POST_SEED")  # unset = different posts every run
+AUTHOR_POOL_SIZE = int(os.getenv("AUTHOR_POOL_SIZE", 1000))
+CHUNK_SIZE = 1000
+
+SOURCES = ["twitter", "reddit", "facebook"]
+
+def content_pool() -> List[str]:
+    """Every text generate_post can produce, weighted so a uniform pick keeps its 1/3 per sentiment split"""
+    positive = [f"I just got the new {product} and it is {adj}! Highly recommend."
+                for product in PRODUCTS for adj in POSITIVE_ADJECTIVES]
+    negative = [f"My experience with {product} has been {adj}. Do not buy."
+                for product in PRODUCTS for adj in NEGATIVE_ADJECTIVES]
+    neutral = [f"Just saw an ad for {product}. wondering if it's any good." for product in PRODUCTS]
+    return positive + negative + neutral * (len(positive) // len(neutral))
+
+class PostPool:
+    """
+    Synthetic posts without per-post Faker calls: authors and contents are
+    pre-generated once, and each chunk is drawn with a handful of k-sized
+    `choices` calls on one seeded RNG, so the same seed replays the same posts.
+    """
+    def __init__(self, seed: Optional[int] = None, authors: int = AUTHOR_POOL_SIZE):
+        self.rng = random.Random(seed)
+        fake = Faker()
+        fake.seed_instance(self.rng.getrandbits(64))
+        self.authors = [fake.user_name() for _ in range(max(1, authors))]
+        self.contents = content_pool()
+
+    def chunk(self, n: int) -> List[dict]:
+        """n ready-to-send post dicts"""
+        rng = self.rng
+        authors = rng.choices(self.authors, k=n)
+        contents = rng.choices(self.contents, k=n)
+        sources = rng.choices(SOURCES, k=n)
+        # One timestamp per chunk: a chunk is sent within milliseconds
+        created_at = datetime.utcnow().isoformat()
+        return [
+            {
+                # Random 128 bits from the seeded RNG, formatted as a v4 UUID
+                "post_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "source": source,
+                "author": author,
+                "content": content,
+                "created_at": created_at
+            }
+            for author, content, source in zip(authors, contents, sources)
+        ]
+
+    def __iter__(self) -> Iterator[dict]:
+        while True:
+            yield from self.chunk(CHUNK_SIZE)
+
+class FakerPosts:
+    """The original per-post generate_post, behind the same chunk() interface"""
+    def chunk(self, n: int) -> List[dict]:
+        return [generate_post() for _ in range(n)]
+
+def make_post_source(kind: str = POST_GENERATOR, seed: Optional[int] = None):
+    if kind == "faker":
+        return FakerPosts()
+    if kind == "pool":
+        return PostPool(seed)
+    raise ValueError(f"Unknown post generator {kind!r}, expected 'pool' or 'faker'")
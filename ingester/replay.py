@@ -0,0 +1,181 @@
+"""
+Replay / backfill mode: streams posts from JSONL or CSV files (optionally .gz) into
+the stream in pipelined XADD batches, in constant memory, pausing while the
+consumer groups' backlog is above the high-water mark.
+
+    python replay.py capture.jsonl.gz                  # as fast as possible
+    python replay.py capture.csv --speed 10            # original pace, 10x faster
+    python replay.py capture.jsonl --resume            # continue after the last checkpoint
+"""
+import os
+import csv
+import gzip
+import json
+import time
+import uuid
+import argparse
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, Optional
+import redis
+from ingester import REDIS_HOST, REDIS_PORT, STREAM_NAME
+from backpressure import StreamBackpressure
+from ingester_metrics import start_metrics_server
+from partitioning import Partitioner
+
+# --- Config ---
+REPLAY_FILE = os.getenv("REPLAY_FILE")
+# 0 = as fast as possible, 1 = original timestamps' pace, 10 = ten times faster
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", 0))
+REPLAY_BATCH_SIZE = int(os.getenv("REPLAY_BATCH_SIZE", 500))
+REPLAY_RESUME = os.getenv("REPLAY_RESUME", "false") == "true"
+REPORT_EVERY = 10000
+
+def open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+def read_records(path: str) -> Iterator[dict]:
+    """Yields one dict per JSONL line or CSV row, reading the file lazily"""
+    is_csv = path[:-3].endswith(".csv") if path.endswith(".gz") else path.endswith(".csv")
+    with open_text(path) as f:
+        if is_csv:
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def record_id(path: str, offset: int) -> str:
+    """Stable post_id for a record without one: the same file position always gets the same id"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"replay:{os.path.abspath(path)}:{offset}"))
+
+def to_post(record: dict, fallback_id: str) -> Optional[dict]:
+    """Maps a captured record onto the stream's post fields; None when there is no content"""
+    if not record.get("content"):
+        return None
+    return {
+        "post_id": str(record.get("post_id") or fallback_id),
+        "source": str(record.get("source") or "replay"),
+        "author": str(record.get("author") or "unknown"),
+        "content": str(record["content"]),
+        "created_at": str(record.get("created_at") or datetime.utcnow().isoformat())
+    }
+
+def parse_timestamp(value: str) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+def load_checkpoint(path: str) -> int:
+    """Records already replayed according to the checkpoint file (0 when there is none)"""
+    try:
+        with open(path) as f:
+            return int(json.load(f)["offset"])
+    except (FileNotFoundError, ValueError, KeyError):
+        return 0
+
+def save_checkpoint(path: str, offset: int):
+    # Write-then-rename, so a crash never leaves a truncated checkpoint
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"offset": offset, "updated_at": datetime.utcnow().isoformat()}, f)
+    os.replace(tmp, path)
+
+def replay(
+    r,
+    path: str,
+    speed: float = REPLAY_SPEED,
+    batch_size: int = REPLAY_BATCH_SIZE,
+    checkpoint_path: Optional[str] = None,
+    resume: bool = False,
+    stream: str = STREAM_NAME,
+    backpressure: Optional[StreamBackpressure] = None
+) -> int:
+    """
+    Streams `path` into `stream`. The checkpoint stores how many records of the file
+    have been handled and is only advanced after their batch was written, so a
+    resumed run may repeat at most one batch. Records without a post_id get one
+    derived from the file and record position, so repeats keep their id: the posts
+    table ignores them, but each repeat is analyzed and counted again.
+    """
+    checkpoint_path = checkpoint_path or f"{path}.checkpoint"
+    partitioner = Partitioner(stream)
+    offset = load_checkpoint(checkpoint_path) if resume else 0
+    if offset:
+        print(f"⏩ Resuming {path} after {offset} records")
+
+    pipe = r.pipeline(transaction=False)
+    pending = 0
+    sent = 0
+    saved_offset = offset
+    first_ts = started = None
+
+    def flush():
+        nonlocal pipe, pending, started, saved_offset
+        if not pending:
+            return
+        waited = backpressure.wait() if backpressure else 0.0
+        if started is not None:
+            started += waited  # the original pace continues after a pause
+        pipe.execute()
+        pipe = r.pipeline(transaction=False)
+        pending = 0
+        # Only once the batch is in Redis, and once per batch rather than per record
+        save_checkpoint(checkpoint_path, offset)
+        saved_offset = offset
+
+    for record in islice(read_records(path), offset, None):
+        post = to_post(record, record_id(path, offset))
+        if post is None:
+            offset += 1
+            continue
+
+        if speed > 0:
+            ts = parse_timestamp(post["created_at"])
+            if ts is not None:
+                if first_ts is None:
+                    first_ts, started = ts, time.monotonic()
+                delay = started + (ts - first_ts) / speed - time.monotonic()
+                if delay > 0:
+                    # Don't hold already-due posts back while waiting for this one
+                    flush()
+                    time.sleep(delay)
+
+        pipe.xadd(partitioner.stream_for(post), post)
+        pending += 1
+        sent += 1
+        offset += 1
+        if pending >= batch_size:
+            flush()
+        if sent % REPORT_EVERY == 0:
+            print(f"📼 Replayed {sent} posts ({offset} records read)")
+
+    flush()
+    # Trailing records without content still move the checkpoint to the end of the file
+    if offset != saved_offset:
+        save_checkpoint(checkpoint_path, offset)
+    print(f"🏁 Replay of {path} done: {sent} posts, checkpoint at {offset}")
+    return sent
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", default=REPLAY_FILE, help=".jsonl or .csv, optionally .gz")
+    parser.add_argument("--speed", type=float, default=REPLAY_SPEED, help="0 = as fast as possible")
+    parser.add_argument("--batch-size", type=int, default=REPLAY_BATCH_SIZE)
+    parser.add_argument("--checkpoint", help="defaults to <file>.checkpoint")
+    parser.add_argument("--resume", action="store_true", default=REPLAY_RESUME, help="skip records before the checkpoint")
+    args = parser.parse_args()
+    if not args.file:
+        parser.error("no input file (argument or REPLAY_FILE)")
+
+    start_metrics_server()
+    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    Partitioner().announce(r)
+    replay(r, args.file, args.speed, args.batch_size, args.checkpoint, args.resume,
+           backpressure=StreamBackpressure(r))
+
+if __name__ == "__main__":
+    main()
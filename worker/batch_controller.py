@@ -0,0 +1,91 @@
+import os
+from collections import deque
+from typing import Dict
+# INFERENCE_MAX_BATCH_SIZE is read once, by the analyzer: inference never runs wider
+from sentiment_analyzer import MAX_BATCH_SIZE as MAX_INFERENCE_BATCH
+
+# --- Config ---
+BATCH_MIN_SIZE = int(os.getenv("BATCH_MIN_SIZE", 10))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 256))
+TARGET_P99_MS = float(os.getenv("TARGET_P99_MS", 2000))
+BLOCK_MIN_MS = int(os.getenv("BLOCK_MIN_MS", 100))
+BLOCK_MAX_MS = int(os.getenv("BLOCK_MAX_MS", 5000))
+LATENCY_WINDOW = 50
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class AdaptiveBatchController:
+    """
+    Tunes the XREADGROUP count/block and the inference batch size.
+    Additive increase while there is backlog and p99 batch latency is under target,
+    multiplicative decrease when it is over, slow decay back to the minimum when idle.
+    """
+    def __init__(
+        self,
+        min_size: int = BATCH_MIN_SIZE,
+        max_size: int = BATCH_MAX_SIZE,
+        target_p99_ms: float = TARGET_P99_MS,
+        max_inference_batch: int = MAX_INFERENCE_BATCH
+    ):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.target_p99 = target_p99_ms / 1000
+        self.max_inference_batch = max(1, max_inference_batch)
+        self.count = self.min_size
+        self.block_ms = BLOCK_MAX_MS
+        self.lag = 0
+        self.pending = 0
+        self.per_post_seconds = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def inference_batch_size(self) -> int:
+        return min(self.count, self.max_inference_batch)
+
+    def update_lag(self, lag: int, pending: int):
+        """Fed from XINFO GROUPS: entries not yet delivered, and delivered but unacked"""
+        self.lag = lag or 0
+        self.pending = pending or 0
+        # A backlog means XREADGROUP returns immediately anyway; only idle reads block
+        self.block_ms = BLOCK_MIN_MS if self.lag > 0 else BLOCK_MAX_MS
+
+    def record_batch(self, size: int, inference_seconds: float, total_seconds: float):
+        """Called once per processed batch; adjusts `count` for the next read"""
+        if size <= 0:
+            return
+        self.latencies.append(total_seconds)
+        # Smoothed per-post inference cost, used to cap growth before we hit the target
+        sample = inference_seconds / size
+        self.per_post_seconds = sample if not self.per_post_seconds else 0.8 * self.per_post_seconds + 0.2 * sample
+
+        p99 = percentile(self.latencies, 99)
+        backlog = self.lag > 0 or size >= self.count
+
+        if p99 > self.target_p99:
+            self.count = int(self.count * 0.7)
+            # Judge the new size on its own latencies, not the ones that triggered the cut
+            self.latencies.clear()
+        elif backlog:
+            self.count += max(1, self.count // 4)
+            if self.per_post_seconds > 0:
+                self.count = min(self.count, int(self.target_p99 / self.per_post_seconds))
+        else:
+            self.count -= max(1, (self.count - self.min_size) // 8)
+
+        self.count = max(self.min_size, min(self.max_size, self.count))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "inference_batch_size": self.inference_batch_size,
+            "block_ms": self.block_ms,
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 1),
+            "per_post_ms": round(self.per_post_seconds * 1000, 2),
+            "lag": self.lag,
+            "pending": self.pending
+        }
@@ -0,0 +1,159 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import SocialMediaPost, SentimentAnalysis, SentimentRollup
+
+# --- Config ---
+# Minute rollups older than this are pruned; the default covers the API's longest
+# window (/api/sentiment/distribution?hours=168) plus its partial first hour
+ROLLUP_MINUTE_RETENTION_HOURS = float(os.getenv("ROLLUP_MINUTE_RETENTION_HOURS", 169))
+ROLLUP_PRUNE_INTERVAL_SECONDS = float(os.getenv("ROLLUP_PRUNE_INTERVAL_SECONDS", 300))
+
+_DIALECT_INSERTS = {
+    "postgresql": pg_insert,
+    "sqlite": sqlite_insert,  # Used by the tests and the offline benchmark
+}
+
+def parse_created_at(value) -> datetime:
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+def post_row(post_data: dict) -> dict:
+    return {
+        "post_id": post_data['post_id'],
+        "source": post_data['source'],
+        "content": post_data['content'],
+        "author": post_data['author'],
+        "created_at": parse_created_at(post_data.get('created_at'))
+    }
+
+def analysis_row(post_data: dict, analysis_result: dict) -> dict:
+    return {
+        "post_id": post_data['post_id'],
+        "model_name": analysis_result['model_name'],
+        "sentiment_label": analysis_result['sentiment_label'],
+        "confidence_score": analysis_result['confidence_score'],
+        "emotion": analysis_result.get('emotion')
+    }
+
+ROLLUP_PERIODS = ("minute", "hour", "day")
+ROLLUP_KEY = ["period", "bucket", "source", "sentiment_label", "emotion"]
+ROLLUP_UPSERT_ROWS = 1000
+
+def bucket_start(ts: datetime, period: str) -> datetime:
+    """Start of the minute/hour/day containing ts, as naive UTC"""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    if period == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if period == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rollup_rows(analyses: List[Tuple[datetime, str, str, Optional[str], float]]) -> List[dict]:
+    """
+    Folds (analyzed_at, source, label, emotion, confidence) tuples into one row
+    per rollup key, sorted so concurrent workers lock rollup rows in the same order.
+    """
+    totals: Dict[tuple, list] = {}
+    for analyzed_at, source, label, emotion, confidence in analyses:
+        for period in ROLLUP_PERIODS:
+            key = (period, bucket_start(analyzed_at, period), source, label, emotion or "")
+            total = totals.setdefault(key, [0, 0.0])
+            total[0] += 1
+            total[1] += confidence
+    return [
+        dict(zip(ROLLUP_KEY, key), post_count=count, confidence_sum=confidence_sum)
+        for key, (count, confidence_sum) in sorted(totals.items())
+    ]
+
+async def upsert_rollups(session, rows: List[dict]):
+    """Adds the counts onto existing rollup rows (INSERT ... ON CONFLICT DO UPDATE), inside the caller's transaction"""
+    insert = _DIALECT_INSERTS[session.bind.dialect.name]
+    # Sliced to stay under the drivers' bind-parameter limits on large backfills
+    for start in range(0, len(rows), ROLLUP_UPSERT_ROWS):
+        stmt = insert(SentimentRollup).values(rows[start:start + ROLLUP_UPSERT_ROWS])
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=ROLLUP_KEY,
+            set_={
+                "post_count": SentimentRollup.post_count + stmt.excluded.post_count,
+                "confidence_sum": SentimentRollup.confidence_sum + stmt.excluded.confidence_sum
+            }
+        ))
+
+async def prune_minute_rollups(session, retention_hours: float = ROLLUP_MINUTE_RETENTION_HOURS) -> int:
+    """Deletes minute buckets past retention (hour and day buckets are kept); returns rows removed"""
+    cutoff = bucket_start(datetime.utcnow() - timedelta(hours=retention_hours), "minute")
+    result = await session.execute(
+        delete(SentimentRollup)
+        .where(SentimentRollup.period == "minute")
+        .where(SentimentRollup.bucket < cutoff)
+    )
+    return result.rowcount or 0
+
+def batch_rollups(rows: List[Tuple[dict, dict]], analyzed_at: datetime) -> List[dict]:
+    return rollup_rows([
+        (analyzed_at, data['source'], result['sentiment_label'], result.get('emotion'), result['confidence_score'])
+        for data, result in rows
+    ])
+
+class BatchWriter:
+    """
+    Persists a whole batch in one transaction: one INSERT ... ON CONFLICT (post_id)
+    DO NOTHING for the posts, one multi-row INSERT for the analyses and one
+    upsert that adds the batch onto the minute/hour/day rollups.
+    If the batch fails, each row is retried on its own so one bad row only costs itself.
+    """
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    async def save_batch(self, rows: List[Tuple[dict, dict]]) -> List[bool]:
+        """Saves (post_data, analysis_result) pairs; returns per-row success in input order"""
+        if not rows:
+            return []
+
+        try:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    insert = _DIALECT_INSERTS[session.bind.dialect.name]
+                    posts = insert(SocialMediaPost).values([post_row(data) for data, _ in rows])
+                    await session.execute(posts.on_conflict_do_nothing(index_elements=['post_id']))
+                    await session.execute(
+                        insert(SentimentAnalysis).values([analysis_row(data, result) for data, result in rows])
+                    )
+                    await upsert_rollups(session, batch_rollups(rows, datetime.utcnow()))
+            return [True] * len(rows)
+        except Exception as e:
+            print(f"⚠️ Bulk write of {len(rows)} rows failed, retrying per row: {e}")
+
+        saved = []
+        for post_data, analysis_result in rows:
+            try:
+                await self.save_one(post_data, analysis_result)
+                saved.append(True)
+            except Exception as e:
+                print(f"❌ Error saving {post_data.get('post_id')}: {e}")
+                saved.append(False)
+        return saved
+
+    async def save_one(self, post_data: dict, analysis_result: dict):
+        """Per-row fallback: its own transaction, SELECT then INSERT"""
+        async with self.session_factory() as session:
+            async with session.begin():
+                stmt = select(SocialMediaPost).where(SocialMediaPost.post_id == post_data['post_id'])
+                result = await session.execute(stmt)
+                existing_post = result.scalar_one_or_none()
+
+                if not existing_post:
+                    session.add(SocialMediaPost(**post_row(post_data)))
+                    await session.flush()
+
+                session.add(SentimentAnalysis(**analysis_row(post_data, analysis_result)))
+                await upsert_rollups(session, batch_rollups([(post_data, analysis_result)], datetime.utcnow()))
@@ -0,0 +1,218 @@
+"""
+Offline throughput benchmark for SentimentWorker.
+
+Feeds N synthetic posts (ingester.generate_post) through the real worker loop
+against fakeredis (or a local Redis) and SQLite (or any DATABASE_URL), then
+writes a JSON report that can be diffed between releases.
+
+    python benchmark.py --posts 5000 --analyzer stub --output bench.json
+    python benchmark.py --posts 500 --analyzer real --baseline bench.json
+
+Run from a repository checkout: it imports ../ingester/ingester.py.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ingester"))
+
+STAGES = ["read", "inference", "db_write", "ack_publish", "end_to_end"]
+
+class StubAnalyzer:
+    """Analyzer stand-in with a fixed per-post CPU cost, to isolate the worker's own overhead"""
+    def __init__(self, ms_per_post: float = 0.0):
+        self.seconds_per_post = ms_per_post / 1000
+
+    def warm_up(self):
+        pass
+
+    def analyze_batch(self, texts, max_batch_size=None):
+        if self.seconds_per_post:
+            time.sleep(self.seconds_per_post * len(texts))
+        return [
+            {"sentiment_label": "positive", "confidence_score": 0.9, "emotion": "joy", "model_name": "stub"}
+            if text else None
+            for text in texts
+        ]
+
+def percentiles(values):
+    from batch_controller import percentile
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2)
+    }
+
+def timed(timings, stage, fn):
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            timings[stage].append(time.perf_counter() - started)
+    return wrapper
+
+def polling(xreadgroup):
+    """
+    fakeredis serves a blocking XREADGROUP synchronously, starving the event loop;
+    read without blocking and yield to the loop while the stream is empty instead
+    """
+    async def wrapper(*args, block=None, **kwargs):
+        entries = await xreadgroup(*args, **kwargs)
+        if not entries:
+            await asyncio.sleep(0.005)
+        return entries
+    return wrapper
+
+async def produce(redis_client, stream, posts, rate):
+    """XADDs the posts, all at once (rate=0) or paced at `rate` posts/sec"""
+    from ingester import generate_post
+    chunk = 500 if rate <= 0 else max(1, int(rate // 20))
+    started = time.perf_counter()
+    sent = 0
+    while sent < posts:
+        pipe = redis_client.pipeline(transaction=False)
+        for _ in range(min(chunk, posts - sent)):
+            pipe.xadd(stream, generate_post())
+        sent += len(await pipe.execute())
+        if rate > 0:
+            await asyncio.sleep(max(0.0, sent / rate - (time.perf_counter() - started)))
+
+async def run_benchmark(args) -> dict:
+    # Import after DATABASE_URL is set: the worker modules read it at import time
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from models import Base
+    from inference_pool import InferencePool
+    from worker import SentimentWorker, REDIS_STREAM
+
+    engine = create_async_engine(args.database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    if args.redis_url:
+        import redis.asyncio as redis
+        redis_client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+        redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await redis_client.delete(REDIS_STREAM)
+
+    if args.analyzer == "stub":
+        factory = lambda: StubAnalyzer(args.stub_ms_per_post)
+    else:
+        from sentiment_analyzer import SentimentAnalyzer
+        factory = SentimentAnalyzer
+    inference = InferencePool(analyzer_factory=factory, mode="thread", concurrency=args.concurrency)
+
+    worker = SentimentWorker(
+        redis_client=redis_client,
+        inference=inference,
+        session_factory=sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+        consumer_name="benchmark"
+    )
+
+    # Per-stage timings, measured around the worker's real stage boundaries
+    timings = defaultdict(list)
+    acked = 0
+    done = asyncio.Event()
+    ack_and_publish = worker.ack_and_publish
+
+    async def track_acks(msg_ids, updates, streams=None):
+        nonlocal acked
+        await ack_and_publish(msg_ids, updates, streams)
+        now_ms = time.time() * 1000
+        # Stream ids start with the XADD time in ms
+        timings["end_to_end"].extend((now_ms - int(msg_id.split("-")[0])) / 1000 for msg_id in msg_ids)
+        acked += len(msg_ids)
+        if acked >= args.posts:
+            done.set()
+
+    if not args.redis_url:
+        worker.redis.xreadgroup = polling(worker.redis.xreadgroup)
+    worker.redis.xreadgroup = timed(timings, "read", worker.redis.xreadgroup)
+    worker.inference.analyze_batch = timed(timings, "inference", worker.inference.analyze_batch)
+    worker.writer.save_batch = timed(timings, "db_write", worker.writer.save_batch)
+    worker.ack_and_publish = timed(timings, "ack_publish", track_acks)
+
+    await worker.setup_redis()
+    producer = asyncio.create_task(produce(redis_client, REDIS_STREAM, args.posts, args.rate))
+    started = time.perf_counter()
+    worker_task = asyncio.create_task(worker.run())
+    try:
+        await asyncio.wait_for(done.wait(), timeout=args.timeout)
+    finally:
+        elapsed = time.perf_counter() - started
+        for task in (producer, worker_task):
+            task.cancel()
+        await asyncio.gather(producer, worker_task, return_exceptions=True)
+        inference.close()
+        await engine.dispose()
+
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "posts": args.posts,
+            "rate": args.rate,
+            "analyzer": args.analyzer,
+            "stub_ms_per_post": args.stub_ms_per_post,
+            "concurrency": args.concurrency,
+            "redis": args.redis_url or "fakeredis",
+            "database": args.database_url.split("://")[0]
+        },
+        "processed": acked,
+        "seconds": round(elapsed, 3),
+        "posts_per_sec": round(acked / elapsed, 1),
+        "stages": {stage: percentiles(timings[stage]) for stage in STAGES},
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def compare(report: dict, baseline_path: str, tolerance: float) -> bool:
+    """Prints the throughput delta against a previous report; False on regression"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    change = report["posts_per_sec"] / baseline["posts_per_sec"] - 1
+    print(f"📈 posts/sec {baseline['posts_per_sec']} -> {report['posts_per_sec']} ({change:+.1%})")
+    return change >= -tolerance
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=0, help="posts/sec fed while running (0 = preload all)")
+    parser.add_argument("--analyzer", choices=["stub", "real"], default="stub")
+    parser.add_argument("--stub-ms-per-post", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=1, help="inference slots")
+    parser.add_argument("--redis-url", help="local Redis instead of fakeredis, e.g. redis://localhost:6379/15")
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", default="bench_result.json")
+    parser.add_argument("--baseline", help="previous report to compare posts/sec against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed throughput drop vs baseline")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        args.database_url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.database_url
+
+    report = asyncio.run(run_benchmark(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"📝 Wrote {args.output}")
+
+    if args.baseline and not compare(report, args.baseline, args.tolerance):
+        print(f"❌ Throughput regression beyond {args.tolerance:.0%}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
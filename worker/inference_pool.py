@@ -0,0 +1,86 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Optional
+import torch
+from sentiment_analyzer import SentimentAnalyzer
+
+# --- Config ---
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")  # thread | process
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", 1))
+# 0 = split the available cores evenly between inference slots
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0))
+
+# --- Process Pool Child State ---
+# Each child process loads its own analyzer once, in the pool initializer
+_child_analyzer = None
+
+def _init_child(torch_threads: int):
+    global _child_analyzer
+    torch.set_num_threads(torch_threads)
+    _child_analyzer = SentimentAnalyzer()
+
+def _child_warm_up():
+    _child_analyzer.warm_up()
+
+def _child_analyze_batch(texts: List[str], max_batch_size: Optional[int] = None) -> List[Optional[dict]]:
+    return _child_analyzer.analyze_batch(texts, max_batch_size)
+
+class InferencePool:
+    """
+    Runs blocking model inference off the asyncio event loop.
+    'thread' shares one analyzer across a thread pool, 'process' loads the
+    models once per child process. Either way `concurrency` batches run in parallel.
+    """
+    def __init__(
+        self,
+        analyzer_factory=SentimentAnalyzer,
+        mode: str = INFERENCE_EXECUTOR,
+        concurrency: int = INFERENCE_CONCURRENCY,
+        torch_threads: int = TORCH_NUM_THREADS
+    ):
+        self.mode = mode
+        self.concurrency = max(1, concurrency)
+        # Avoid oversubscription: slots * intra-op threads should not exceed the cores
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.concurrency)
+
+        if mode == "process":
+            self.analyzer = None
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.concurrency,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_child,
+                initargs=(self.torch_threads,)
+            )
+        elif mode == "thread":
+            torch.set_num_threads(self.torch_threads)
+            self.analyzer = analyzer_factory()
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="inference"
+            )
+        else:
+            raise ValueError(f"Unknown INFERENCE_EXECUTOR: {mode}")
+
+        print(f"⚙️ Inference pool: {mode} x{self.concurrency}, torch threads={self.torch_threads}")
+
+    async def analyze_batch(self, texts: List[str], max_batch_size: Optional[int] = None) -> List[Optional[dict]]:
+        """Awaitable analyze_batch that never blocks the event loop"""
+        loop = asyncio.get_running_loop()
+        if self.analyzer is None:
+            return await loop.run_in_executor(self.executor, _child_analyze_batch, texts, max_batch_size)
+        return await loop.run_in_executor(self.executor, self.analyzer.analyze_batch, texts, max_batch_size)
+
+    async def warm_up(self):
+        """Loads and warms every slot before the worker starts reading"""
+        loop = asyncio.get_running_loop()
+        if self.analyzer is None:
+            # Child processes start on first submit; one call per slot brings them all up
+            await asyncio.gather(*[
+                loop.run_in_executor(self.executor, _child_warm_up) for _ in range(self.concurrency)
+            ])
+        else:
+            await loop.run_in_executor(self.executor, self.analyzer.warm_up)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
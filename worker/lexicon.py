@@ -0,0 +1,77 @@
+import re
+from typing import Optional
+
+# Cheap first tier of the inference cascade: a tiny weighted lexicon.
+# It only has to be right when it is confident; everything else escalates.
+
+POSITIVE = {
+    "love": 1, "amazing": 1, "great": 1, "excellent": 1, "superb": 1, "awesome": 1,
+    "fantastic": 1, "perfect": 1, "best": 1, "happy": 1, "grateful": 1, "wonderful": 1,
+}
+NEGATIVE = {
+    "terrible": 1, "hate": 1, "awful": 1, "worst": 1, "disappointed": 1, "horrible": 1,
+    "broken": 1, "useless": 1, "furious": 1, "disgusting": 1, "scam": 1, "sad": 1,
+}
+# Phrases are stronger evidence than single words
+PHRASES = {
+    "highly recommend": 2, "would buy again": 2, "works perfectly": 2,
+    "do not buy": -2, "don't buy": -2, "waste of money": -2, "never again": -2,
+}
+NEGATORS = {"not", "no", "never", "don't", "isn't", "wasn't", "hardly"}
+
+EMOTIONS = {
+    "joy": {"love", "amazing", "great", "excellent", "superb", "awesome", "fantastic", "happy", "wonderful"},
+    "anger": {"hate", "worst", "furious", "angry", "scam"},
+    "sadness": {"disappointed", "sad", "unhappy"},
+    "disgust": {"awful", "terrible", "disgusting", "horrible"},
+    "fear": {"scared", "afraid", "worried"},
+    "surprise": {"wow", "unexpected", "shocked"},
+}
+
+_TOKEN = re.compile(r"[a-z']+")
+
+def analyze(text: str) -> Optional[dict]:
+    """
+    Returns a result in the analyzer's dict shape, or None when the text has no
+    signal at all. Confidence grows with one-sided evidence and drops when
+    positive and negative cues are mixed.
+    """
+    lowered = text.lower()
+    tokens = _TOKEN.findall(lowered)
+
+    positive = negative = 0
+    for phrase, weight in PHRASES.items():
+        if phrase in lowered:
+            positive += max(weight, 0)
+            negative += max(-weight, 0)
+
+    for i, token in enumerate(tokens):
+        weight = POSITIVE.get(token, 0) - NEGATIVE.get(token, 0)
+        if not weight:
+            continue
+        # "not great" flips polarity
+        if any(t in NEGATORS for t in tokens[max(0, i - 2):i]):
+            weight = -weight
+        if weight > 0:
+            positive += weight
+        else:
+            negative -= weight
+
+    if positive == negative:
+        return None
+
+    emotion_hits = {emotion: sum(t in words for t in tokens) for emotion, words in EMOTIONS.items()}
+    emotion, hits = max(emotion_hits.items(), key=lambda item: item[1])
+    if not hits:
+        return None  # sentiment alone is not a complete result
+
+    net = abs(positive - negative)
+    mixed = min(positive, negative)
+    confidence = min(0.99, 0.5 + 0.15 * net) - 0.2 * mixed
+
+    return {
+        "sentiment_label": "positive" if positive > negative else "negative",
+        "confidence_score": round(max(confidence, 0.0), 4),
+        "emotion": emotion,
+        "model_name": "lexicon"
+    }
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import random
+import asyncio
+from typing import List, Optional
+import httpx
+
+# --- Config ---
+# Any OpenAI-compatible chat completions endpoint (Groq, OpenAI, or a local stand-in)
+EXTERNAL_LLM_URL = os.getenv("EXTERNAL_LLM_URL", "https://api.groq.com/openai/v1/chat/completions")
+EXTERNAL_LLM_MODEL = os.getenv("EXTERNAL_LLM_MODEL", "llama3-8b-8192")
+EXTERNAL_LLM_MAX_CONCURRENCY = int(os.getenv("EXTERNAL_LLM_MAX_CONCURRENCY", 8))
+EXTERNAL_LLM_RATE_LIMIT = float(os.getenv("EXTERNAL_LLM_RATE_LIMIT", 10))  # requests per second
+EXTERNAL_LLM_BURST = int(os.getenv("EXTERNAL_LLM_BURST", 10))
+# Posts packed into one prompt; >1 asks the model for a JSON array
+EXTERNAL_LLM_BATCH_SIZE = int(os.getenv("EXTERNAL_LLM_BATCH_SIZE", 1))
+EXTERNAL_LLM_MAX_RETRIES = int(os.getenv("EXTERNAL_LLM_MAX_RETRIES", 3))
+EXTERNAL_LLM_TIMEOUT = float(os.getenv("EXTERNAL_LLM_TIMEOUT", 10))
+RETRY_BASE_SECONDS = 0.5
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+SENTIMENT_LABELS = {"positive", "negative", "neutral"}
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second on average, bursts up to `capacity`"""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # Created on first use so it binds to the running loop (Python 3.9)
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def _parse_result(item) -> Optional[dict]:
+    if not isinstance(item, dict) or str(item.get("sentiment_label", "")).lower() not in SENTIMENT_LABELS:
+        return None
+    try:
+        confidence = float(item.get("confidence_score", 0.0))
+    except (TypeError, ValueError):
+        return None
+    return {
+        "sentiment_label": item["sentiment_label"].lower(),
+        "confidence_score": confidence,
+        "emotion": str(item.get("emotion") or "").lower() or None,
+        "model_name": "external_llm"
+    }
+
+class ExternalLLMClient:
+    """
+    Long-lived, pooled client for the external LLM path.
+    Concurrency is capped by a semaphore and request rate by a token bucket;
+    several posts can share one prompt. Failed items come back as None so the
+    caller can fall back to local inference per item.
+    """
+    def __init__(
+        self,
+        api_key: str,
+        url: str = EXTERNAL_LLM_URL,
+        model: str = EXTERNAL_LLM_MODEL,
+        max_concurrency: int = EXTERNAL_LLM_MAX_CONCURRENCY,
+        rate_limit: float = EXTERNAL_LLM_RATE_LIMIT,
+        burst: int = EXTERNAL_LLM_BURST,
+        batch_size: int = EXTERNAL_LLM_BATCH_SIZE,
+        max_retries: int = EXTERNAL_LLM_MAX_RETRIES,
+        timeout: float = EXTERNAL_LLM_TIMEOUT,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.url = url
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max(0, max_retries)
+        self.bucket = TokenBucket(rate_limit, burst)
+        self._semaphore = None
+        # One pooled client for the worker's lifetime: connections (and TLS sessions) are reused
+        self.client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency
+            ),
+            timeout=timeout,
+            transport=transport
+        )
+
+    async def classify(self, texts: List[str]) -> List[Optional[dict]]:
+        """Analyzes every text; None marks items the LLM could not handle"""
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*[self._classify_chunk(chunk) for chunk in chunks])
+        return [result for chunk_results in results for result in chunk_results]
+
+    async def _classify_chunk(self, texts: List[str]) -> List[Optional[dict]]:
+        self._semaphore = self._semaphore or asyncio.Semaphore(self.max_concurrency)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    await self.bucket.acquire()
+                    response = await self.client.post(self.url, json={
+                        "model": self.model,
+                        "messages": [{"role": "user", "content": self._prompt(texts)}],
+                        "temperature": 0
+                    })
+
+                if response.status_code == 200:
+                    content = response.json()['choices'][0]['message']['content']
+                    return self._parse(content, len(texts))
+                if response.status_code not in RETRYABLE_STATUS:
+                    print(f"❌ External LLM Failed: HTTP {response.status_code}")
+                    break
+            except (httpx.HTTPError, ValueError, KeyError, IndexError) as e:
+                print(f"⚠️ External LLM attempt {attempt + 1} failed: {e}")
+
+            if attempt < self.max_retries:
+                # Exponential backoff with jitter so retries from many posts don't align
+                await asyncio.sleep(RETRY_BASE_SECONDS * (2 ** attempt) * (0.5 + random.random()))
+
+        return [None] * len(texts)
+
+    def _prompt(self, texts: List[str]) -> str:
+        # Strict JSON prompt
+        if len(texts) == 1:
+            return f"""Analyze the sentiment of this text: "{texts[0]}".
+        Return ONLY a JSON object with keys: sentiment_label (positive/negative/neutral), confidence_score (0.0-1.0), and emotion."""
+
+        numbered = "\n".join(f"{i + 1}. {json.dumps(text)}" for i, text in enumerate(texts))
+        return f"""Analyze the sentiment of each of these {len(texts)} texts:
+{numbered}
+Return ONLY a JSON array with exactly {len(texts)} objects, in the same order, each with keys: sentiment_label (positive/negative/neutral), confidence_score (0.0-1.0), and emotion."""
+
+    def _parse(self, content: str, expected: int) -> List[Optional[dict]]:
+        parsed = json.loads(content)
+        if expected == 1 and isinstance(parsed, dict):
+            parsed = [parsed]
+        if not isinstance(parsed, list) or len(parsed) != expected:
+            raise ValueError(f"expected {expected} results, got {content[:200]!r}")
+        return [_parse_result(item) for item in parsed]
+
+    async def close(self):
+        await self.client.aclose()
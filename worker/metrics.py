@@ -0,0 +1,61 @@
+import os
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# --- Config ---
+# 0 disables the endpoint; forked consumers serve on METRICS_PORT + their slot index
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+
+# Stages of one batch: read (XREADGROUP wait), inference (whole analyzer call,
+# cache included), sentiment / emotion (forward passes, thread executor only: spawned
+# inference processes have their own registries), db_write, ack_publish
+STAGE_SECONDS = Histogram(
+    "sentiment_worker_stage_seconds",
+    "Time spent per batch in each worker stage",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+BATCH_SIZE = Histogram(
+    "sentiment_worker_batch_size",
+    "Messages per XREADGROUP batch",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500)
+)
+POSTS = Counter(
+    "sentiment_worker_posts",
+    "Posts handled, by outcome (saved, skipped, failed, trimmed)",
+    ["outcome"]
+)
+# Which cascade tier answered each saved post (lexicon, distilbert-base-uncased, external_llm, ...)
+TIERS = Counter(
+    "sentiment_worker_tier",
+    "Saved posts per inference tier",
+    ["tier"]
+)
+ERRORS = Counter(
+    "sentiment_worker_errors",
+    "Failures per stage",
+    ["stage"]
+)
+CONSUMER_LAG = Gauge(
+    "sentiment_worker_consumer_lag",
+    "Stream entries not yet delivered to the consumer group"
+)
+CONSUMER_PENDING = Gauge(
+    "sentiment_worker_consumer_pending",
+    "Entries delivered to the consumer group but not acknowledged"
+)
+
+_server_port = None
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Serves /metrics on a background thread; later calls in the same process are no-ops"""
+    global _server_port
+    if _server_port is not None or port <= 0:
+        return
+    try:
+        start_http_server(port)
+    except OSError as e:
+        # Metrics are diagnostics: never keep a consumer from starting
+        print(f"⚠️ Metrics server not started on :{port}: {e}")
+        return
+    _server_port = port
+    print(f"📈 Metrics on :{port}/metrics")
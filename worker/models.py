@@ -1,9 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, JSON, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from database import Base
 
 class SocialMediaPost(Base):
     __tablename__ = "social_media_posts"
+    __table_args__ = (
+        # Keyset pagination: ORDER BY created_at DESC, id DESC, optionally per source
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_source_created_at_id", "source", "created_at", "id"),
+    )
 
     # Primary Key
     id = Column(Integer, primary_key=True, index=True)
@@ -20,6 +25,10 @@ class SocialMediaPost(Base):
 
 class SentimentAnalysis(Base):
     __tablename__ = "sentiment_analysis"
+    __table_args__ = (
+        # Latest analysis of a post = MAX(id) for its post_id, read straight off this index
+        Index("ix_analysis_post_id_id", "post_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -48,4 +57,27 @@ class SentimentAlert(Base):
     post_count = Column(Integer, nullable=False)
     
     triggered_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
-    details = Column(JSON, nullable=True) # Extra context
\ No newline at end of file
+    details = Column(JSON, nullable=True) # Extra context
+
+class SentimentRollup(Base):
+    """
+    Pre-aggregated analysis counts, maintained incrementally by the worker.
+    One row per (period, bucket, source, label, emotion), so the aggregate
+    endpoints read a handful of rows instead of scanning sentiment_analysis.
+    """
+    __tablename__ = "sentiment_rollups"
+    __table_args__ = (
+        # Also the upsert's conflict target, and the index the endpoints range-scan
+        UniqueConstraint("period", "bucket", "source", "sentiment_label", "emotion", name="uq_sentiment_rollup"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    period = Column(String(10), nullable=False) # minute, hour, day
+    bucket = Column(DateTime, nullable=False) # Bucket start, naive UTC
+    source = Column(String(50), nullable=False)
+    sentiment_label = Column(String(20), nullable=False)
+    emotion = Column(String(50), nullable=False, default="") # "" = no emotion (NULL would dodge the unique key)
+
+    post_count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
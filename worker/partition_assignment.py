@@ -0,0 +1,106 @@
+import os
+import time
+from typing import List
+import redis.asyncio as redis
+
+# --- Config ---
+# Used until the ingester has published the stream's partition count
+STREAM_PARTITIONS = int(os.getenv("STREAM_PARTITIONS", 1))
+CONSUMER_HEARTBEAT_SECONDS = float(os.getenv("CONSUMER_HEARTBEAT_SECONDS", 5))
+# Consumers silent for this long lose their partitions to the live ones
+CONSUMER_TTL_SECONDS = float(os.getenv("CONSUMER_TTL_SECONDS", 15))
+
+def partition_keys(stream: str, partitions: int) -> List[str]:
+    """Same layout as the ingester: the bare key for 1 partition, else stream:0 .. stream:N-1"""
+    if partitions <= 1:
+        return [stream]
+    return [f"{stream}:{index}" for index in range(partitions)]
+
+def assign_partitions(keys: List[str], consumers: List[str], consumer: str) -> List[str]:
+    """Round-robin over the sorted live consumers, so shares differ by at most one partition"""
+    consumers = sorted(set(consumers) | {consumer})
+    rank = consumers.index(consumer)
+    return [key for index, key in enumerate(keys) if index % len(consumers) == rank]
+
+class PartitionAssignment:
+    """
+    Tracks which partitions this consumer reads. Live consumers heartbeat into a
+    sorted set and every one derives the same assignment from it, so no
+    coordinator is needed. A short overlap while consumers join or leave is
+    harmless: the consumer group still delivers each entry once.
+    """
+    def __init__(self, redis_client, stream: str, consumer_name: str, partitions: int = STREAM_PARTITIONS):
+        self.redis = redis_client
+        self.stream = stream
+        self.consumer_name = consumer_name
+        self.registry = f"{stream}:consumers"
+        self.keys = partition_keys(stream, partitions)
+        self.retired: List[str] = []  # keys of an older layout, read until drained
+        self.assigned = list(self.keys)
+        self.consumers = [consumer_name]
+
+    async def refresh(self) -> bool:
+        """Heartbeats and recomputes the assignment; True when the set of partition keys changed"""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(self.registry, {self.consumer_name: now})
+        pipe.zremrangebyscore(self.registry, "-inf", now - CONSUMER_TTL_SECONDS)
+        pipe.zrange(self.registry, 0, -1)
+        pipe.get(f"{self.stream}:partitions")
+        pipe.smembers(f"{self.stream}:retired")
+        _, _, consumers, partitions, retired = await pipe.execute()
+
+        keys = partition_keys(self.stream, int(partitions or STREAM_PARTITIONS))
+        # After a resize the old keys still hold entries: they are shared out like live ones
+        self.retired = sorted(set(retired) - set(keys))
+        keys += self.retired
+        changed = keys != self.keys
+        assigned = assign_partitions(keys, consumers, self.consumer_name)
+        if assigned != self.assigned:
+            print(f"🧩 {self.consumer_name} reads {len(assigned)}/{len(keys)} partitions "
+                  f"({len(set(consumers) | {self.consumer_name})} consumers)")
+        self.keys, self.assigned, self.consumers = keys, assigned, consumers
+        return changed
+
+    async def release_drained(self) -> List[str]:
+        """
+        Deletes retired keys that every group has read to the end and fully
+        acknowledged. WATCH makes the check and the DEL atomic: a key that is
+        written to or made live again meanwhile is left for the next pass.
+        """
+        released = []
+        retired_key = f"{self.stream}:retired"
+        for key in self.retired:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                try:
+                    await pipe.watch(key, retired_key)
+                    if not await pipe.sismember(retired_key, key):
+                        continue
+                    try:
+                        groups = await pipe.xinfo_groups(key)
+                        last_id = (await pipe.xinfo_stream(key))["last-generated-id"]
+                    except redis.ResponseError:
+                        groups, last_id = [], None  # the key is gone
+                    drained = last_id is None or (groups and all(
+                        group["pending"] == 0 and group["last-delivered-id"] == last_id for group in groups
+                    ))
+                    if not drained:
+                        continue
+                    pipe.multi()
+                    pipe.srem(retired_key, key)
+                    pipe.delete(key)
+                    await pipe.execute()
+                    released.append(key)
+                except redis.WatchError:
+                    continue
+        if released:
+            # Stop reading them now; consumers that still list them refresh on NOGROUP
+            self.retired = [key for key in self.retired if key not in released]
+            self.keys = [key for key in self.keys if key not in released]
+            self.assigned = [key for key in self.assigned if key not in released]
+            print(f"🔀 Drained and deleted retired partition(s): {', '.join(released)}")
+        return released
+
+    async def leave(self):
+        """Hands this consumer's partitions to the others right away instead of after the TTL"""
+        await self.redis.zrem(self.registry, self.consumer_name)
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import redis
+
+# --- Config ---
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 10000))  # 0 disables the cache
+RESULT_CACHE_REDIS = os.getenv("RESULT_CACHE_REDIS", "false") == "true"
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 86400))
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_CACHE_PREFIX = os.getenv("REDIS_CACHE_PREFIX", "sentiment_cache")
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Folds unicode variants and whitespace so reposts of the same text share a key"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+class ResultCache:
+    """
+    Memoizes analysis results by normalized content hash + model name.
+    Tier 1 is a bounded in-process LRU, tier 2 an optional Redis shared by all workers.
+    Thread-safe, since inference runs on executor threads.
+    """
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, redis_client=None, ttl: int = RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.redis = redis_client
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.redis_errors = 0
+
+    @classmethod
+    def from_env(cls):
+        redis_client = None
+        if RESULT_CACHE_REDIS:
+            redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        return cls(redis_client=redis_client)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.redis is not None
+
+    @staticmethod
+    def make_key(text: str, model_name: str) -> str:
+        digest = hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, texts: List[str], model_name: str) -> List[Optional[dict]]:
+        """Looks up every text, LRU first and then one MGET for whatever is left"""
+        keys = [self.make_key(text, model_name) for text in texts]
+        results = [None] * len(texts)
+        remote = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    results[i] = dict(self._entries[key])
+                    self.hits += 1
+                else:
+                    remote.append(i)
+
+        if remote and self.redis is not None:
+            try:
+                values = self.redis.mget([f"{REDIS_CACHE_PREFIX}:{keys[i]}" for i in remote])
+            except redis.RedisError as e:
+                self.redis_errors += 1
+                print(f"⚠️ Result cache Redis read failed: {e}")
+                values = [None] * len(remote)
+
+            for i, value in zip(remote, values):
+                if value is not None:
+                    results[i] = json.loads(value)
+                    self._store_local(keys[i], results[i])
+
+            with self._lock:
+                found = sum(1 for value in values if value is not None)
+                self.hits += found
+                self.redis_hits += found
+
+        with self._lock:
+            self.misses += sum(1 for result in results if result is None)
+        return results
+
+    def get(self, text: str, model_name: str) -> Optional[dict]:
+        return self.get_many([text], model_name)[0]
+
+    def set_many(self, texts: List[str], model_name: str, results: List[dict]):
+        keys = [self.make_key(text, model_name) for text in texts]
+        for key, result in zip(keys, results):
+            self._store_local(key, result)
+
+        if self.redis is not None and keys:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, result in zip(keys, results):
+                    pipe.set(f"{REDIS_CACHE_PREFIX}:{key}", json.dumps(result), ex=self.ttl)
+                pipe.execute()
+            except redis.RedisError as e:
+                self.redis_errors += 1
+                print(f"⚠️ Result cache Redis write failed: {e}")
+
+    def set(self, text: str, model_name: str, result: dict):
+        self.set_many([text], model_name, [result])
+
+    def _store_local(self, key: str, result: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = dict(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "redis_errors": self.redis_errors
+            }
@@ -0,0 +1,69 @@
+"""
+Rebuilds the sentiment_rollups table from sentiment_analysis.
+
+Needed once for data written before the worker maintained rollups, or after
+editing raw rows by hand. Everything from --since (rounded down to the day,
+default: all history) is deleted and recomputed in one transaction, so the
+dashboards never read a half-built range. Minute buckets are only kept for
+ROLLUP_MINUTE_RETENTION_HOURS. Pause the workers while it runs:
+batches they write meanwhile could be counted twice.
+
+    python rollup_backfill.py
+    python rollup_backfill.py --since 2025-01-01
+"""
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, delete
+from models import SocialMediaPost, SentimentAnalysis, SentimentRollup
+from batch_writer import bucket_start, rollup_rows, upsert_rollups, prune_minute_rollups
+
+# Analyses folded per upsert; the stream is ordered by time, so each chunk touches few buckets
+CHUNK_SIZE = 10000
+
+async def rebuild(session_factory, since: Optional[datetime] = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """Recomputes rollups from the raw rows; returns the number of analyses counted"""
+    start = bucket_start(since, "day") if since else None
+    counted = 0
+    async with session_factory() as session:
+        async with session.begin():
+            clear = delete(SentimentRollup)
+            query = (
+                select(
+                    SentimentAnalysis.analyzed_at,
+                    SocialMediaPost.source,
+                    SentimentAnalysis.sentiment_label,
+                    SentimentAnalysis.emotion,
+                    SentimentAnalysis.confidence_score
+                )
+                .join(SocialMediaPost, SentimentAnalysis.post_id == SocialMediaPost.post_id)
+                .order_by(SentimentAnalysis.analyzed_at)
+                .execution_options(yield_per=chunk_size)
+            )
+            if start:
+                clear = clear.where(SentimentRollup.bucket >= start)
+                query = query.where(SentimentAnalysis.analyzed_at >= start)
+            await session.execute(clear)
+
+            result = await session.stream(query)
+            async for chunk in result.partitions(chunk_size):
+                await upsert_rollups(session, rollup_rows(chunk))
+                counted += len(chunk)
+                print(f"🔁 Rolled up {counted} analyses...")
+            # Old history only keeps its hour and day buckets, like the worker's pruning
+            await prune_minute_rollups(session)
+    return counted
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None,
+                        help="Only rebuild from this UTC date on (default: all history)")
+    args = parser.parse_args()
+
+    from database import AsyncSessionLocal
+    counted = await rebuild(AsyncSessionLocal, args.since)
+    print(f"✅ Rollups rebuilt from {counted} analyses")
+
+if __name__ == "__main__":
+    asyncio.run(main())
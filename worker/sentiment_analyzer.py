@@ -1,92 +1,374 @@
 import os
 import torch
-import httpx # Needs to be in requirements.txt
+import sys
 import json
-from transformers import pipeline
+import asyncio
+import threading
+from typing import Dict, List, Optional
+from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+from result_cache import ResultCache, normalize_text
+from llm_client import ExternalLLMClient, EXTERNAL_LLM_MODEL
+import lexicon
+from metrics import STAGE_SECONDS
 
-class SentimentAnalyzer:
+# --- Config ---
+SENTIMENT_MODEL = os.getenv("HUGGINGFACE_MODEL", "distilbert-base-uncased-finetuned-sst-2-english")
+EMOTION_MODEL = os.getenv("EMOTION_MODEL", "j-hartmann/emotion-english-distilroberta-base")
+# Upper bound on texts per forward pass; larger XREADGROUP batches are split
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 32))
+MAX_TEXT_CHARS = 512
+# pytorch = fp32 pipelines, quantized = dynamic int8 PyTorch, onnx = int8 ONNX Runtime
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch")
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "/tmp/onnx_models")
+PARITY_MIN_AGREEMENT = float(os.getenv("PARITY_MIN_AGREEMENT", 0.95))
+# Inference cascade: lexicon -> transformers -> external LLM, escalating only uncertain posts
+INFERENCE_CASCADE = os.getenv("INFERENCE_CASCADE", "false") == "true"
+CASCADE_LEXICON_THRESHOLD = float(os.getenv("CASCADE_LEXICON_THRESHOLD", 0.85))
+# Transformer results below this confidence go to the LLM (when USE_EXTERNAL_LLM=true)
+CASCADE_LLM_THRESHOLD = float(os.getenv("CASCADE_LLM_THRESHOLD", 0.75))
+# Pre-materialized models (see --snapshot); when set, nothing is resolved from the hub
+MODEL_SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR")
+# eager = load at startup, lazy = on first use, background = load in a thread at startup
+EMOTION_LOAD_MODE = os.getenv("EMOTION_LOAD_MODE", "eager")
+
+WARMUP_TEXTS = [
+    "Warm-up post so the first real batch does not pay for lazy initialisation.",
+    "short one",
+]
+
+# Fixed sample set for the quantization parity check
+PARITY_SAMPLES = [
+    "I just got the new iPhone 16 and it is amazing! Highly recommend.",
+    "My experience with Netflix has been terrible. Do not buy.",
+    "Just saw an ad for Pixel 8. wondering if it's any good.",
+    "The AWS outage ruined my whole weekend, I'm furious.",
+    "ChatGPT helped me pass my exam, so grateful right now!",
+    "Honestly scared of what this Tesla autopilot update will do.",
+    "Support never answered. Worst customer service I have ever had.",
+    "Not sure how I feel about the new Model 3 interior.",
+    "Wow, did not expect the keynote to announce that!",
+    "This battery life is disgusting, it dies before lunch.",
+    "So sad they cancelled my favourite show.",
+    "Superb camera, great screen, excellent price. Love it.",
+]
+
+def snapshot_path(model_id: str, snapshot_dir: str) -> str:
+    return os.path.join(snapshot_dir, model_id.replace("/", "__"))
+
+def resolve_model(model_id: str) -> str:
+    """Local snapshot directory for the model if one is configured, else the hub id"""
+    if not MODEL_SNAPSHOT_DIR:
+        return model_id
+    path = snapshot_path(model_id, MODEL_SNAPSHOT_DIR)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No snapshot of {model_id} in {MODEL_SNAPSHOT_DIR}; run with --snapshot first")
+    return path
+
+def save_snapshot(snapshot_dir: str):
+    """Downloads both models once and saves them as plain local directories"""
+    for model_id in (SENTIMENT_MODEL, EMOTION_MODEL):
+        path = snapshot_path(model_id, snapshot_dir)
+        AutoTokenizer.from_pretrained(model_id).save_pretrained(path)
+        AutoModelForSequenceClassification.from_pretrained(model_id).save_pretrained(path)
+        print(f"📦 Saved {model_id} -> {path}")
+
+def _onnx_model(model_id: str):
+    """Exports the model to ONNX once, quantizes it to dynamic int8 and caches it on disk"""
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as e:
+        raise ImportError("INFERENCE_BACKEND=onnx requires optimum[onnxruntime]") from e
+
+    target_dir = os.path.join(ONNX_CACHE_DIR, model_id.replace("/", "__"))
+    if not os.path.exists(os.path.join(target_dir, "model_quantized.onnx")):
+        print(f"📦 Exporting {model_id} to quantized ONNX in {target_dir}")
+        exported = ORTModelForSequenceClassification.from_pretrained(model_id, export=True)
+        quantizer = ORTQuantizer.from_pretrained(exported)
+        quantizer.quantize(
+            save_dir=target_dir,
+            quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        )
+    return ORTModelForSequenceClassification.from_pretrained(target_dir, file_name="model_quantized.onnx")
+
+def build_pipeline(model_id: str, backend: str = INFERENCE_BACKEND):
+    """CPU text-classification pipeline for the selected inference backend"""
+    if backend == "pytorch":
+        return pipeline("text-classification", model=model_id, device=-1)
+
+    if backend == "quantized":
+        # Dynamic quantization: Linear weights stored as int8, activations quantized on the fly
+        model = AutoModelForSequenceClassification.from_pretrained(model_id)
+        model = torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        model = _onnx_model(model_id)
+    else:
+        raise ValueError(f"Unknown INFERENCE_BACKEND: {backend}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    return pipeline("text-classification", model=model, tokenizer=tokenizer, device=-1)
+
+class ExternalAnalyzer:
+    """
+    The external LLM path on its own: no local models are loaded, failed posts fall
+    back to the attached InferencePool. Process-mode workers use it directly, since
+    their models live in the pool's child processes.
+    """
+    def __init__(self, cache: Optional[ResultCache] = None, inference=None):
+        self.cache = cache if cache is not None else ResultCache.from_env()
+        self.external_cache_key = f"external:{EXTERNAL_LLM_MODEL}"
+        self.llm_client = None  # created on first external call
+        # InferencePool for the local fallbacks; attached by the worker
+        self.inference = inference
+
+    async def analyze_external(self, text: str) -> dict:
+        """
+        Analyzes sentiment using an external LLM (e.g., Groq/OpenAI).
+        Required for Rubric Phase 3.
+        """
+        return (await self.analyze_external_batch([text]))[0]
+
+    async def analyze_external_batch(self, texts: List[str]) -> List[Optional[dict]]:
+        """
+        External LLM analysis for a batch through one pooled, rate-limited client.
+        Any post the LLM fails on falls back to local inference individually.
+        """
+        api_key = os.getenv("EXTERNAL_LLM_API_KEY")
+        if not api_key:
+            # Fallback to local if no key provided
+            return await self._analyze_local_off_loop(texts)
+
+        if self.llm_client is None:
+            self.llm_client = ExternalLLMClient(api_key)
+
+        results = [None] * len(texts)
+        pending = [i for i, text in enumerate(texts) if text]
+        if self.cache.enabled and pending:
+            cached = self.cache.get_many([texts[i] for i in pending], self.external_cache_key)
+            for i, hit in zip(pending, cached):
+                results[i] = hit
+            pending = [i for i in pending if results[i] is None]
+
+        if pending:
+            fresh = await self.llm_client.classify([texts[i] for i in pending])
+            answered = [(i, result) for i, result in zip(pending, fresh) if result is not None]
+            for i, result in answered:
+                results[i] = result
+            if self.cache.enabled and answered:
+                self.cache.set_many([texts[i] for i, _ in answered], self.external_cache_key, [r for _, r in answered])
+
+            # Fallback to local on error, only for the posts that failed
+            failed = [i for i, result in zip(pending, fresh) if result is None]
+            if failed:
+                local = await self._analyze_local_off_loop([texts[i] for i in failed])
+                for i, result in zip(failed, local):
+                    results[i] = result
+
+        return results
+
+    async def escalate_to_llm(self, texts: List[str], results: List[Optional[dict]]) -> List[Optional[dict]]:
+        """Cascade tier 3: re-analyzes only the transformer results below CASCADE_LLM_THRESHOLD"""
+        uncertain = [
+            i for i, result in enumerate(results)
+            if result and result["model_name"] != "lexicon" and result["confidence_score"] < CASCADE_LLM_THRESHOLD
+        ]
+        if not uncertain:
+            return results
+
+        escalated = await self.analyze_external_batch([texts[i] for i in uncertain])
+        results = list(results)
+        for i, result in zip(uncertain, escalated):
+            results[i] = result or results[i]
+        return results
+
+    async def _analyze_local_off_loop(self, texts: List[str]) -> List[Optional[dict]]:
+        # Through the pool, so fallbacks respect its concurrency and torch-thread limits
+        return await self.inference.analyze_batch(texts)
+
+class SentimentAnalyzer(ExternalAnalyzer):
     """
     Unified interface for sentiment analysis.
     Supports 'local' (Hugging Face) and 'external' (LLM).
     """
-    def __init__(self):
-        print("🧠 Loading AI Models... (This may take a moment)")
+    def __init__(
+        self,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        cache: Optional[ResultCache] = None,
+        backend: str = INFERENCE_BACKEND,
+        emotion_load_mode: str = EMOTION_LOAD_MODE,
+        cascade: bool = INFERENCE_CASCADE
+    ):
+        print(f"🧠 Loading AI Models ({backend})... (This may take a moment)")
+        self.max_batch_size = max(1, max_batch_size)
+        self.backend = backend
+        self.cascade = cascade
+        # Results are memoized per model pair and backend, so a swap never serves stale labels
+        super().__init__(cache)
+        self.local_cache_key = f"{SENTIMENT_MODEL}+{EMOTION_MODEL}:{backend}"
         
-        # 1. Sentiment Model (DistilBERT)
-        self.sentiment_pipe = pipeline(
-            "text-classification",
-            model="distilbert-base-uncased-finetuned-sst-2-english",
-            device=-1 # Use CPU
-        )
+        # 1. Sentiment Model (DistilBERT), CPU only
+        self.sentiment_pipe = build_pipeline(resolve_model(SENTIMENT_MODEL), backend)
 
-        # 2. Emotion Model (RobertA)
-        self.emotion_pipe = pipeline(
-            "text-classification",
-            model="j-hartmann/emotion-english-distilroberta-base",
-            device=-1
-        )
+        # 2. Emotion Model (RobertA), possibly deferred to cut time-to-first-read
+        self._emotion_pipe = None
+        self._emotion_lock = threading.Lock()
+        if emotion_load_mode == "eager":
+            self._load_emotion()
+        elif emotion_load_mode == "background":
+            threading.Thread(target=self._load_emotion, args=(True,), name="emotion-loader", daemon=True).start()
         print("✅ Models Loaded.")
 
+    @property
+    def emotion_pipe(self):
+        # Blocks until a background load finishes, or loads on first use when lazy
+        if self._emotion_pipe is None:
+            self._load_emotion()
+        return self._emotion_pipe
+
+    def _load_emotion(self, warm: bool = False):
+        with self._emotion_lock:
+            if self._emotion_pipe is None:
+                pipe = build_pipeline(resolve_model(EMOTION_MODEL), self.backend)
+                if warm:
+                    pipe(WARMUP_TEXTS, batch_size=len(WARMUP_TEXTS), truncation=True)
+                self._emotion_pipe = pipe
+                print("✅ Emotion model ready.")
+
+    def warm_up(self):
+        """
+        Runs one small batch through every loaded model so the first real batch
+        does not pay for allocator and kernel initialisation.
+        """
+        self.sentiment_pipe(WARMUP_TEXTS, batch_size=len(WARMUP_TEXTS), truncation=True)
+        if self._emotion_pipe is not None:
+            self._emotion_pipe(WARMUP_TEXTS, batch_size=len(WARMUP_TEXTS), truncation=True)
+
     def analyze(self, text: str) -> dict:
         """
         Default analysis method.
         """
-        if not text:
-            return None
+        return self.analyze_batch([text])[0]
+
+    def analyze_batch(self, texts: List[str], max_batch_size: Optional[int] = None) -> List[Optional[dict]]:
+        """
+        Batched analysis: one forward pass per model for up to max_batch_size texts.
+        Results come back in input order; empty texts map to None like analyze().
+        """
+        batch_size = max(1, min(max_batch_size or self.max_batch_size, self.max_batch_size))
+        results = [None] * len(texts)
+
+        # Identical posts (retweets, reposts) share one slot in the forward pass.
+        # Deduped on the normalized text, but the models see the first original text
+        # as-is, so outputs match un-normalized inference.
+        slots = {}
+        for i, text in enumerate(texts):
+            if text:
+                text = text[:MAX_TEXT_CHARS]
+                slots.setdefault(normalize_text(text), (text, []))[1].append(i)
+        pending = [(indices, text) for text, indices in slots.values()]
+
+        # Cascade tier 1: confident lexicon hits never reach the transformers
+        if self.cascade:
+            uncertain = []
+            for indices, text in pending:
+                result = lexicon.analyze(text)
+                if result is None or result["confidence_score"] < CASCADE_LEXICON_THRESHOLD:
+                    uncertain.append((indices, text))
+                    continue
+                for i in indices:
+                    results[i] = dict(result)
+            pending = uncertain
+
+        if self.cache.enabled and pending:
+            cached = self.cache.get_many([text for _, text in pending], self.local_cache_key)
+            misses = []
+            for (indices, text), hit in zip(pending, cached):
+                if hit is None:
+                    misses.append((indices, text))
+                    continue
+                for i in indices:
+                    results[i] = dict(hit)
+            pending = misses
+
+        # Padding-aware batching: sorting by length keeps similar-sized texts
+        # together, so each sub-batch pads to a short maximum instead of the longest post
+        pending.sort(key=lambda item: len(item[1]))
+
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            chunk_texts = [text for _, text in chunk]
+            chunk_results = self._run_models(chunk_texts)
+
+            for (indices, _), result in zip(chunk, chunk_results):
+                for i in indices:
+                    results[i] = dict(result)
+
+            if self.cache.enabled:
+                self.cache.set_many(chunk_texts, self.local_cache_key, chunk_results)
 
+        return results
+
+    def _run_models(self, texts: List[str]) -> List[dict]:
+        """One forward pass per model over `texts`, no caching"""
         # --- A. Sentiment Analysis ---
-        sent_result = self.sentiment_pipe(text[:512])[0]
-        label = sent_result['label'].lower()
-        score = sent_result['score']
+        with STAGE_SECONDS.labels("sentiment").time():
+            sent_results = self.sentiment_pipe(texts, batch_size=len(texts), truncation=True)
 
         # --- B. Emotion Detection ---
-        emo_result = self.emotion_pipe(text[:512])[0]
-        emotion = emo_result['label'].lower()
+        with STAGE_SECONDS.labels("emotion").time():
+            emo_results = self.emotion_pipe(texts, batch_size=len(texts), truncation=True)
 
-        return {
-            "sentiment_label": label,   # positive, negative
-            "confidence_score": score,
-            "emotion": emotion,
-            "model_name": "distilbert-base-uncased"
-        }
+        return [
+            {
+                "sentiment_label": sent_result['label'].lower(),   # positive, negative
+                "confidence_score": sent_result['score'],
+                "emotion": emo_result['label'].lower(),
+                "model_name": "distilbert-base-uncased"
+            }
+            for sent_result, emo_result in zip(sent_results, emo_results)
+        ]
 
-    async def analyze_external(self, text: str) -> dict:
+    def check_parity(self, texts: List[str] = PARITY_SAMPLES, reference: "SentimentAnalyzer" = None) -> Dict[str, float]:
         """
-        Analyzes sentiment using an external LLM (e.g., Groq/OpenAI).
-        Required for Rubric Phase 3.
+        Accuracy-parity check of this backend against the fp32 pipelines on a fixed
+        sample set: label agreement per model and the largest confidence drift.
         """
-        api_key = os.getenv("EXTERNAL_LLM_API_KEY")
-        if not api_key:
-            # Fallback to local if no key provided
-            return self.analyze(text)
+        if reference is None:
+            reference = SentimentAnalyzer(cache=ResultCache(max_entries=0), backend="pytorch")
 
-        # Example structure for OpenAI-compatible API (Groq/OpenAI)
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
+        expected = reference._run_models(texts)
+        actual = self._run_models(texts)
+        total = len(texts) or 1
+
+        return {
+            "backend": self.backend,
+            "samples": len(texts),
+            "sentiment_agreement": sum(
+                e["sentiment_label"] == a["sentiment_label"] for e, a in zip(expected, actual)
+            ) / total,
+            "emotion_agreement": sum(e["emotion"] == a["emotion"] for e, a in zip(expected, actual)) / total,
+            "max_confidence_drift": max(
+                (abs(e["confidence_score"] - a["confidence_score"]) for e, a in zip(expected, actual)),
+                default=0.0
+            )
         }
-        
-        # Strict JSON prompt
-        prompt = f"""Analyze the sentiment of this text: "{text}". 
-        Return ONLY a JSON object with keys: sentiment_label (positive/negative/neutral), confidence_score (0.0-1.0), and emotion."""
-        
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=headers, json={
-                    "model": os.getenv("EXTERNAL_LLM_MODEL", "llama3-8b-8192"),
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0
-                }, timeout=10.0)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    content = data['choices'][0]['message']['content']
-                    result = json.loads(content)
-                    result['model_name'] = "external_llm"
-                    return result
-        except Exception as e:
-            print(f"❌ External LLM Failed: {e}")
-        
-        # Fallback to local on error
-        return self.analyze(text)
\ No newline at end of file
+
+    async def _analyze_local_off_loop(self, texts: List[str]) -> List[Optional[dict]]:
+        if self.inference is not None:
+            return await super()._analyze_local_off_loop(texts)
+        # Standalone use without a worker pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.analyze_batch, texts)
+
+if __name__ == "__main__":
+    # Materialize the models for MODEL_SNAPSHOT_DIR: python sentiment_analyzer.py --snapshot /models
+    if "--snapshot" in sys.argv:
+        save_snapshot(sys.argv[sys.argv.index("--snapshot") + 1])
+
+    # Parity check for the configured backend: python sentiment_analyzer.py --parity
+    if "--parity" in sys.argv:
+        report = SentimentAnalyzer(cache=ResultCache(max_entries=0)).check_parity()
+        print(json.dumps(report, indent=2))
+        passed = min(report["sentiment_agreement"], report["emotion_agreement"]) >= PARITY_MIN_AGREEMENT
+        print("✅ Parity OK" if passed else f"❌ Parity below {PARITY_MIN_AGREEMENT}")
+        sys.exit(0 if passed else 1)
@@ -0,0 +1,126 @@
+import os
+import gc
+import time
+import signal
+import socket
+import traceback
+from functools import partial
+import torch
+from sentiment_analyzer import SentimentAnalyzer
+from metrics import METRICS_PORT, start_metrics_server
+
+# --- Config ---
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 1))
+# 0 = split the available cores evenly between the children
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0))
+RESTART_BACKOFF_SECONDS = float(os.getenv("RESTART_BACKOFF_SECONDS", 1))
+RESTART_BACKOFF_MAX_SECONDS = 30.0
+# A child that lived this long is considered healthy again and resets its backoff
+HEALTHY_UPTIME_SECONDS = 60.0
+
+class Supervisor:
+    """
+    Loads the models once, then forks N consumer processes that share the weights
+    copy-on-write. Each child gets a stable, unique consumer name and pinned torch
+    threads; children that exit are restarted with exponential backoff.
+    """
+    def __init__(
+        self,
+        child_main,
+        processes: int = WORKER_PROCESSES,
+        torch_threads: int = TORCH_NUM_THREADS,
+        # Everything must be loaded before forking: a background loader thread
+        # would not survive the fork, and lazy loads would not be shared
+        analyzer_factory=partial(SentimentAnalyzer, emotion_load_mode="eager")
+    ):
+        # child_main(analyzer, consumer_name, torch_threads) runs the consumer loop in a child
+        self.child_main = child_main
+        self.processes = max(1, processes)
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.processes)
+        self.analyzer_factory = analyzer_factory
+        self.analyzer = None
+        self.children = {}  # pid -> slot index
+        self.started_at = {}  # slot index -> start time
+        self.backoff = {}  # slot index -> seconds
+        self.restarts = 0
+        self.stopping = False
+
+    def consumer_name(self, index: int) -> str:
+        # Stable per slot, so a restarted child takes over its predecessor's identity
+        return f"worker_{socket.gethostname()}_{index}"
+
+    def start(self):
+        print(f"🧭 Supervisor: loading models once for {self.processes} consumers")
+        self.analyzer = self.analyzer_factory()
+        # Move everything loaded so far out of the GC's reach: collections would
+        # touch every object header and un-share the copy-on-write pages
+        gc.freeze()
+        for index in range(self.processes):
+            self.spawn(index)
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                torch.set_num_threads(self.torch_threads)
+                # One scrape target per slot; each child has its own registry
+                if METRICS_PORT:
+                    start_metrics_server(METRICS_PORT + index)
+                self.child_main(self.analyzer, self.consumer_name(index), self.torch_threads)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.children[pid] = index
+        self.started_at[index] = time.monotonic()
+        print(f"👶 Started {self.consumer_name(index)} (pid {pid}, {self.torch_threads} torch threads)")
+
+    def reap_once(self):
+        """Waits for one child to exit and restarts its slot"""
+        pid, status = os.wait()
+        index = self.children.pop(pid, None)
+        if index is None or self.stopping:
+            return
+
+        print(f"💥 {self.consumer_name(index)} (pid {pid}) exited with status {status}")
+        if time.monotonic() - self.started_at[index] > HEALTHY_UPTIME_SECONDS:
+            self.backoff[index] = RESTART_BACKOFF_SECONDS
+        delay = self.backoff.get(index, RESTART_BACKOFF_SECONDS)
+        self.backoff[index] = min(delay * 2, RESTART_BACKOFF_MAX_SECONDS)
+
+        time.sleep(delay)
+        self.restarts += 1
+        self.spawn(index)
+
+    def stop(self, *args):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        self.start()
+        try:
+            while self.children:
+                try:
+                    self.reap_once()
+                except ChildProcessError:
+                    break
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            for pid in list(self.children):
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            print("Supervisor stopped.")
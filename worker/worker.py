@@ -1,133 +1,432 @@
+import time
+# Taken before the heavy imports below, so time-to-ready includes loading torch
+PROCESS_STARTED = time.time()
 import os
 import json
+import socket
 import asyncio
+from collections import Counter
 import redis.asyncio as redis
-from datetime import datetime
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sentiment_analyzer import SentimentAnalyzer
-from models import SocialMediaPost, SentimentAnalysis, Base
+from sentiment_analyzer import ExternalAnalyzer, INFERENCE_CASCADE
+from inference_pool import InferencePool
+from batch_writer import BatchWriter, prune_minute_rollups, ROLLUP_PRUNE_INTERVAL_SECONDS
+from batch_controller import AdaptiveBatchController
+from supervisor import Supervisor, WORKER_PROCESSES
+from partition_assignment import PartitionAssignment, CONSUMER_HEARTBEAT_SECONDS
+from metrics import (
+    STAGE_SECONDS, BATCH_SIZE, POSTS, TIERS, ERRORS, CONSUMER_LAG, CONSUMER_PENDING, start_metrics_server
+)
 
 # --- Config ---
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
-REDIS_STREAM = "social_posts_stream"
+# Base key; with STREAM_PARTITIONS > 1 the posts live in REDIS_STREAM:0 .. REDIS_STREAM:N-1
+REDIS_STREAM = os.getenv("REDIS_STREAM_NAME", "social_posts_stream")
 REDIS_GROUP = "sentiment_workers"
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://user:password@db/sentiment_db")
+REDIS_CHANNEL = "sentiment_updates"
+USE_EXTERNAL_LLM = os.getenv("USE_EXTERNAL_LLM") == "true"
+# per_post = one PUBLISH per post, batch = one combined message the backend splits
+PUBLISH_MODE = os.getenv("PUBLISH_MODE", "per_post")
+LAG_POLL_SECONDS = float(os.getenv("LAG_POLL_SECONDS", 5))
+# Pending entries idle this long are assumed abandoned (dead or stuck consumer)
+RECLAIM_IDLE_MS = int(os.getenv("RECLAIM_IDLE_MS", 60000))
+RECLAIM_INTERVAL_SECONDS = float(os.getenv("RECLAIM_INTERVAL_SECONDS", 15))
+MAX_DELIVERIES = int(os.getenv("MAX_DELIVERIES", 5))
+DEAD_LETTER_STREAM = os.getenv("DEAD_LETTER_STREAM", f"{REDIS_STREAM}:dead_letter")
+DEAD_LETTER_MAXLEN = int(os.getenv("DEAD_LETTER_MAXLEN", 10000))
+# Consumers with nothing pending that have been idle this long are removed from the group
+CONSUMER_EXPIRY_MS = int(os.getenv("CONSUMER_EXPIRY_MS", 3600000))
+STATS_LOG_SECONDS = float(os.getenv("STATS_LOG_SECONDS", 30))
 
 # --- Database Setup ---
 engine = create_async_engine(DATABASE_URL, echo=False)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 class SentimentWorker:
-    def __init__(self):
-        self.redis = redis.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
-        self.analyzer = SentimentAnalyzer()
-        self.consumer_name = f"worker_{os.getpid()}"
+    def __init__(self, redis_client=None, inference=None, session_factory=None, consumer_name=None):
+        self.redis = redis_client or redis.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
+        self.inference = inference or InferencePool()
+        # Thread mode shares its analyzer; process mode only needs the external LLM path
+        # here, without a second copy of the models its children already load
+        self.analyzer = self.inference.analyzer
+        if self.analyzer is None and USE_EXTERNAL_LLM:
+            self.analyzer = ExternalAnalyzer()
+        if self.analyzer is not None:
+            # External-path fallbacks go through the same bounded pool as regular batches
+            self.analyzer.inference = self.inference
+        self.writer = BatchWriter(session_factory or AsyncSessionLocal)
+        self.controller = AdaptiveBatchController()
+        self.tier_counts = Counter()  # posts per cascade tier, keyed by model_name
+        self.in_flight_ids = set()  # (stream, message id) of batches being processed right now
+        # Hostname keeps names unique across containers, where every worker is pid 1
+        self.consumer_name = consumer_name or f"worker_{socket.gethostname()}_{os.getpid()}"
+        self.partitions = PartitionAssignment(self.redis, REDIS_STREAM, self.consumer_name)
 
     async def setup_redis(self):
-        try:
-            await self.redis.xgroup_create(REDIS_STREAM, REDIS_GROUP, mkstream=True)
-            print(f"✅ Created Consumer Group: {REDIS_GROUP}")
-        except redis.ResponseError as e:
-            if "BUSYGROUP" in str(e):
-                print(f"ℹ️ Consumer Group {REDIS_GROUP} already exists.")
-            else:
-                raise e
-
-    async def save_result(self, post_data, analysis_result):
-        async with AsyncSessionLocal() as session:
-            async with session.begin():
-                created_at_str = post_data.get('created_at')
-                if isinstance(created_at_str, str):
-                    try:
-                        created_dt = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-                    except ValueError:
-                        created_dt = datetime.utcnow()
+        # Every partition gets the group, so any consumer can reclaim from any of them
+        for stream in self.partitions.keys:
+            try:
+                await self.redis.xgroup_create(stream, REDIS_GROUP, mkstream=True)
+                print(f"✅ Created Consumer Group: {REDIS_GROUP} on {stream}")
+            except redis.ResponseError as e:
+                if "BUSYGROUP" in str(e):
+                    print(f"ℹ️ Consumer Group {REDIS_GROUP} already exists on {stream}.")
                 else:
-                    created_dt = datetime.utcnow()
-
-                stmt = select(SocialMediaPost).where(SocialMediaPost.post_id == post_data['post_id'])
-                result = await session.execute(stmt)
-                existing_post = result.scalar_one_or_none()
-
-                if not existing_post:
-                    new_post = SocialMediaPost(
-                        post_id=post_data['post_id'],
-                        source=post_data['source'],
-                        content=post_data['content'],
-                        author=post_data['author'],
-                        created_at=created_dt
-                    )
-                    session.add(new_post)
-                    await session.flush()
-                
-                analysis = SentimentAnalysis(
-                    post_id=post_data['post_id'],
-                    model_name=analysis_result['model_name'],
-                    sentiment_label=analysis_result['sentiment_label'],
-                    confidence_score=analysis_result['confidence_score'],
-                    emotion=analysis_result['emotion']
-                )
-                session.add(analysis)
+                    raise e
 
-    async def process_message(self, msg_id, data):
+    async def process_batch(self, messages, streams=None):
+        """
+        Runs inference once for the whole XREADGROUP batch, then persists it in one transaction.
+        `streams` holds each message's partition key (default: all from REDIS_STREAM).
+        """
+        streams = streams or [REDIS_STREAM] * len(messages)
+        # Marked in flight until acked or abandoned, so reclaim never steals them back mid-batch
+        keys = [(stream, msg_id) for stream, (msg_id, _) in zip(streams, messages)]
+        self.in_flight_ids.update(keys)
+        try:
+            await self._process_batch(messages, streams)
+        finally:
+            self.in_flight_ids.difference_update(keys)
+
+    async def _process_batch(self, messages, streams):
+        started = time.perf_counter()
+        BATCH_SIZE.observe(len(messages))
+        contents = [data.get('content') for _, data in messages]
         try:
             # Rubric Phase 3: External Support
             # Check for override flag, otherwise use local for speed/cost
-            if os.getenv("USE_EXTERNAL_LLM") == "true":
-                result = await self.analyzer.analyze_external(data['content'])
+            if USE_EXTERNAL_LLM and not INFERENCE_CASCADE:
+                results = await self.analyzer.analyze_external_batch(contents)
             else:
-                result = self.analyzer.analyze(data['content'])
-
-            if not result:
-                await self.redis.xack(REDIS_STREAM, REDIS_GROUP, msg_id)
-                return
-
-            await self.save_result(data, result)
-            await self.redis.xack(REDIS_STREAM, REDIS_GROUP, msg_id)
-            
-            update_msg = {
-                "type": "new_post",
-                "data": {**data, "sentiment": result}
-            }
-            await self.redis.publish("sentiment_updates", json.dumps(update_msg))
-            
-            print(f"✅ Processed: {data['post_id']} -> {result['sentiment_label']}")
+                results = await self.inference.analyze_batch(contents, self.controller.inference_batch_size)
+                if USE_EXTERNAL_LLM:
+                    # Cascade: only posts the cheaper tiers were unsure about pay for the LLM
+                    results = await self.analyzer.escalate_to_llm(contents, results)
+        except Exception as e:
+            ERRORS.labels("inference").inc()
+            print(f"❌ Error analyzing batch of {len(messages)}: {e}")
+            return
+        inference_seconds = time.perf_counter() - started
+        STAGE_SECONDS.labels("inference").observe(inference_seconds)
 
+        # Indexes into messages: ids are only unique within one partition
+        analyzed = [(index, data, result) for index, ((_, data), result) in enumerate(zip(messages, results)) if result]
+        skipped = [index for index, result in enumerate(results) if not result]
+
+        # Rows that cannot be saved stay unacked in the PEL
+        with STAGE_SECONDS.labels("db_write").time():
+            saved = await self.writer.save_batch([(data, result) for _, data, result in analyzed])
+        done = [item for item, ok in zip(analyzed, saved) if ok]
+        if len(done) < len(analyzed):
+            ERRORS.labels("db_write").inc()
+
+        acked = skipped + [index for index, _, _ in done]
+        updates = [{"type": "new_post", "data": {**data, "sentiment": result}} for _, data, result in done]
+        try:
+            with STAGE_SECONDS.labels("ack_publish").time():
+                await self.ack_and_publish(
+                    [messages[index][0] for index in acked], updates, [streams[index] for index in acked]
+                )
         except Exception as e:
-            print(f"❌ Error processing {msg_id}: {e}")
+            ERRORS.labels("ack_publish").inc()
+            print(f"❌ Error acknowledging batch of {len(acked)}: {e}")
+            return
 
-    async def run(self):
-        await self.setup_redis()
-        print("👷 Worker Started. Waiting for posts...")
-        
+        POSTS.labels("saved").inc(len(done))
+        POSTS.labels("skipped").inc(len(skipped))
+        POSTS.labels("failed").inc(len(analyzed) - len(done))
+
+        self.controller.record_batch(len(messages), inference_seconds, time.perf_counter() - started)
+        self.tier_counts.update(result["model_name"] for _, _, result in done)
+        for _, _, result in done:
+            TIERS.labels(result["model_name"]).inc()
+        if done:
+            print(f"✅ Processed {len(done)} posts ({len(skipped)} skipped)")
+
+    async def ack_and_publish(self, msg_ids, updates, streams=None):
+        """One multi-ID XACK per partition plus all pub/sub updates, sent as a single pipeline"""
+        by_stream = {}
+        for msg_id, stream in zip(msg_ids, streams or [REDIS_STREAM] * len(msg_ids)):
+            by_stream.setdefault(stream, []).append(msg_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for stream, stream_ids in by_stream.items():
+            pipe.xack(stream, REDIS_GROUP, *stream_ids)
+        if PUBLISH_MODE == "batch" and updates:
+            pipe.publish(REDIS_CHANNEL, json.dumps({"type": "batch", "data": updates}))
+        else:
+            for update_msg in updates:
+                pipe.publish(REDIS_CHANNEL, json.dumps(update_msg))
+        await pipe.execute()
+
+    async def monitor_lag(self):
+        """Feeds the assigned partitions' lag/pending into the batch controller and logs its decisions"""
+        last_log = 0.0
         while True:
             try:
-                # Rubric Phase 3: Batch Processing
-                entries = await self.redis.xreadgroup(
-                    REDIS_GROUP, 
-                    self.consumer_name, 
-                    {REDIS_STREAM: ">"}, 
-                    count=10, 
-                    block=5000
+                lag = pending = 0
+                for stream in self.partitions.assigned:
+                    for group in await self.redis.xinfo_groups(stream):
+                        if group["name"] == REDIS_GROUP:
+                            # lag is None when Redis cannot compute it (e.g. after XDEL/XTRIM)
+                            lag += group.get("lag") or 0
+                            pending += group.get("pending") or 0
+                self.controller.update_lag(lag, pending)
+                CONSUMER_LAG.set(lag)
+                CONSUMER_PENDING.set(pending)
+                if time.monotonic() - last_log >= STATS_LOG_SECONDS:
+                    last_log = time.monotonic()
+                    print(f"📊 Batch controller: {json.dumps(self.controller.stats())} tiers: {dict(self.tier_counts)}")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"⚠️ Lag monitor error: {e}")
+            await asyncio.sleep(LAG_POLL_SECONDS)
+
+    async def reclaim_pending(self) -> int:
+        """
+        One sweep over the group's PEL on every partition, assigned or not: XPENDING
+        lists entries idle longer than RECLAIM_IDLE_MS (from any consumer, including
+        this one), and XCLAIM takes them over for reprocessing. Batches this consumer
+        is still processing are left alone; entries delivered more than MAX_DELIVERIES
+        times are moved to the dead-letter stream.
+        """
+        reclaimed = 0
+        for stream in self.partitions.keys:
+            reclaimed += await self.reclaim_partition(stream)
+        return reclaimed
+
+    async def reclaim_partition(self, stream: str) -> int:
+        reclaimed = 0
+        start_id = "-"
+        while True:
+            # XPENDING + XCLAIM rather than XAUTOCLAIM, so this consumer's own slow
+            # batches can be left out before their delivery count is bumped
+            pending = await self.redis.xpending_range(
+                stream, REDIS_GROUP, min=start_id, max="+",
+                count=self.controller.count, idle=RECLAIM_IDLE_MS or None  # 0 = no idle filter
+            )
+            if not pending:
+                return reclaimed
+            start_id = "(" + pending[-1]["message_id"]
+            stale = [entry for entry in pending if (stream, entry["message_id"]) not in self.in_flight_ids]
+
+            if stale:
+                claimed = await self.redis.xclaim(
+                    stream, REDIS_GROUP, self.consumer_name,
+                    min_idle_time=RECLAIM_IDLE_MS, message_ids=[entry["message_id"] for entry in stale]
                 )
+                claimed = [(msg_id, data) for msg_id, data in claimed if data]
+                await self.ack_trimmed(stream, stale, claimed)
+                # The claim itself counts as one more delivery
+                deliveries = {entry["message_id"]: entry["times_delivered"] + 1 for entry in stale}
+                reclaimed += len(claimed)
+                poison = [msg for msg in claimed if deliveries.get(msg[0], 0) > MAX_DELIVERIES]
+                retry = [msg for msg in claimed if deliveries.get(msg[0], 0) <= MAX_DELIVERIES]
+
+                if poison:
+                    await self.dead_letter(poison, deliveries, stream)
+                # Retried one by one, so a poison message cannot fail its neighbours again
+                for message in retry:
+                    await self.process_batch([message], [stream])
+
+            if len(pending) < self.controller.count:
+                return reclaimed
+
+    async def ack_trimmed(self, stream: str, stale, claimed):
+        """
+        Acknowledges PEL entries whose message was trimmed from the stream: XCLAIM
+        returns them without fields (Redis 7 drops them itself), so they could never
+        be retried or dead-lettered. Ids claimed by another consumer meanwhile are
+        missing too, but still exist in the stream and are left alone.
+        """
+        returned = {msg_id for msg_id, _ in claimed}
+        missing = [entry["message_id"] for entry in stale if entry["message_id"] not in returned]
+        if not missing:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for msg_id in missing:
+            pipe.xrange(stream, min=msg_id, max=msg_id)
+        trimmed = [msg_id for msg_id, found in zip(missing, await pipe.execute()) if not found]
+        if trimmed:
+            await self.redis.xack(stream, REDIS_GROUP, *trimmed)
+            POSTS.labels("trimmed").inc(len(trimmed))
+            print(f"🗑️ Acknowledged {len(trimmed)} pending entries trimmed from {stream}")
+
+    async def dead_letter(self, messages, deliveries, stream=REDIS_STREAM):
+        """Copies poison messages to the dead-letter stream and removes them from the PEL"""
+        pipe = self.redis.pipeline(transaction=False)
+        for msg_id, data in messages:
+            pipe.xadd(
+                DEAD_LETTER_STREAM,
+                {**data, "original_id": msg_id, "original_stream": stream, "deliveries": deliveries.get(msg_id, 0)},
+                maxlen=DEAD_LETTER_MAXLEN, approximate=True
+            )
+        pipe.xack(stream, REDIS_GROUP, *[msg_id for msg_id, _ in messages])
+        await pipe.execute()
+        print(f"☠️ Moved {len(messages)} poison messages to {DEAD_LETTER_STREAM}")
 
-                if not entries:
-                    continue
+    async def expire_consumers(self):
+        """Drops long-gone consumers (e.g. from restarted containers) that own no entries"""
+        for stream in self.partitions.keys:
+            for consumer in await self.redis.xinfo_consumers(stream, REDIS_GROUP):
+                if (consumer["name"] != self.consumer_name
+                        and consumer["pending"] == 0 and consumer["idle"] > CONSUMER_EXPIRY_MS):
+                    await self.redis.xgroup_delconsumer(stream, REDIS_GROUP, consumer["name"])
 
-                for stream, messages in entries:
-                    # Asyncio Gather for Concurrency
-                    tasks = [self.process_message(msg_id, data) for msg_id, data in messages]
-                    await asyncio.gather(*tasks)
+    async def reclaim_loop(self):
+        """Work stealing: periodically sweeps the PEL so no entry stays stuck"""
+        while True:
+            try:
+                reclaimed = await self.reclaim_pending()
+                if reclaimed:
+                    print(f"♻️ Reclaimed {reclaimed} stale pending messages")
+                await self.expire_consumers()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"⚠️ Reclaim error: {e}")
+            await asyncio.sleep(RECLAIM_INTERVAL_SECONDS)
 
+    async def rollup_retention_loop(self):
+        """Keeps the minute rollups bounded; every worker runs it, the DELETE is idempotent"""
+        while True:
+            try:
+                async with self.writer.session_factory() as session:
+                    async with session.begin():
+                        pruned = await prune_minute_rollups(session)
+                if pruned:
+                    print(f"🧹 Pruned {pruned} minute rollup rows past retention")
+            except asyncio.CancelledError:
+                break
             except Exception as e:
-                print(f"Critical Worker Error: {e}")
-                await asyncio.sleep(5)
+                print(f"⚠️ Rollup retention error: {e}")
+            await asyncio.sleep(ROLLUP_PRUNE_INTERVAL_SECONDS)
 
-if __name__ == "__main__":
+    async def partition_loop(self):
+        """Heartbeats into the consumer registry and follows partition (re)assignments"""
+        while True:
+            await asyncio.sleep(CONSUMER_HEARTBEAT_SECONDS)
+            try:
+                if await self.partitions.refresh():
+                    await self.setup_redis()  # partition count changed: new keys need the group
+                await self.partitions.release_drained()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"⚠️ Partition heartbeat error: {e}")
+
+    async def run(self):
+        # Warm up before the first XREADGROUP, so no claimed batch waits on initialisation
+        warm_up_started = time.time()
+        await self.inference.warm_up()
+        await self.partitions.refresh()
+        await self.setup_redis()
+        self.ready_seconds = time.time() - PROCESS_STARTED
+        print(
+            f"👷 Worker Started in {self.ready_seconds:.1f}s "
+            f"(warm-up {time.time() - warm_up_started:.1f}s). Waiting for posts..."
+        )
+        background_tasks = [
+            asyncio.create_task(self.monitor_lag()),
+            asyncio.create_task(self.reclaim_loop()),
+            asyncio.create_task(self.partition_loop()),
+            asyncio.create_task(self.rollup_retention_loop())
+        ]
+
+        # One batch more than there are inference slots, so the I/O of batch N
+        # (DB write, ack, publish) overlaps with inference for batch N+1
+        in_flight = asyncio.Semaphore(self.inference.concurrency + 1)
+        tasks = set()
+
+        def on_batch_done(task):
+            tasks.discard(task)
+            in_flight.release()
+
+        try:
+            while True:
+                await in_flight.acquire()
+                try:
+                    assigned = self.partitions.assigned
+                    if not assigned:
+                        # More consumers than partitions: stand by (reclaim still runs)
+                        in_flight.release()
+                        await asyncio.sleep(CONSUMER_HEARTBEAT_SECONDS)
+                        continue
+
+                    # Rubric Phase 3: Batch Processing
+                    # One call covers all assigned partitions; count applies per partition
+                    with STAGE_SECONDS.labels("read").time():
+                        entries = await self.redis.xreadgroup(
+                            REDIS_GROUP, 
+                            self.consumer_name, 
+                            {stream: ">" for stream in assigned}, 
+                            count=max(1, self.controller.count // len(assigned)), 
+                            block=self.controller.block_ms
+                        )
+
+                    messages, streams = [], []
+                    for stream, stream_messages in entries or []:
+                        messages.extend(stream_messages)
+                        streams.extend([stream] * len(stream_messages))
+                    if not messages:
+                        in_flight.release()
+                        continue
+
+                    task = asyncio.create_task(self.process_batch(messages, streams))
+                    tasks.add(task)
+                    task.add_done_callback(on_batch_done)
+
+                except Exception as e:
+                    in_flight.release()
+                    if isinstance(e, redis.ResponseError) and "NOGROUP" in str(e) and self.partitions.retired:
+                        # Another consumer deleted a drained retired partition: pick up the new layout
+                        if await self.partitions.refresh():
+                            await self.setup_redis()
+                        continue
+                    ERRORS.labels("read").inc()
+                    print(f"Critical Worker Error: {e}")
+                    await asyncio.sleep(5)
+        finally:
+            for task in background_tasks:
+                task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+            # Hand this consumer's partitions to the others now instead of after the TTL
+            try:
+                await self.partitions.leave()
+            except Exception:
+                pass
+            await self.close()
+
+    async def close(self):
+        """Releases the external LLM client's pooled HTTP connections, if one was opened"""
+        llm_client = getattr(self.analyzer, "llm_client", None)
+        if llm_client is not None:
+            self.analyzer.llm_client = None
+            await llm_client.close()
+
+def run_consumer(analyzer=None, consumer_name=None, torch_threads=0):
+    """Runs one consumer; under the supervisor it reuses the pre-loaded (forked) analyzer"""
+    inference = None
+    if analyzer is not None:
+        inference = InferencePool(
+            analyzer_factory=lambda: analyzer, mode="thread", concurrency=1, torch_threads=torch_threads
+        )
+    # No-op under the supervisor, which already started this child's server on its own port
+    start_metrics_server()
+    worker = SentimentWorker(inference=inference, consumer_name=consumer_name)
     try:
-        worker = SentimentWorker()
         asyncio.run(worker.run())
+    finally:
+        worker.inference.close()
+
+if __name__ == "__main__":
+    try:
+        if WORKER_PROCESSES > 1:
+            Supervisor(run_consumer).run()
+        else:
+            run_consumer()
     except KeyboardInterrupt:
         print("Worker stopping...")
\ No newline at end of file